@@ -1,2 +0,0 @@
-from .index import Index
-from .extract import get_index_data
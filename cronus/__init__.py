@@ -1 +1,8 @@
-from .cronus import Cronus
\ No newline at end of file
+def __getattr__(name):
+    # the crawler (sqlalchemy, aiohttp, requests ...) is only loaded
+    # when it's asked for, so `cronus.store` can be used on its own
+    if name == "Cronus":
+        from .cronus import Cronus
+        return Cronus
+
+    raise AttributeError("module %r has no attribute %r" % (__name__, name))
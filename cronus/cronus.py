@@ -1,27 +1,53 @@
-from .db import DB
-import sqlalchemy
-from sqlalchemy import Integer, Text
+from .db import DB, param
+from .engine import AsyncEngine
+from .dedupe import SeenURLs
+from .store import FileStore, SegmentStore
+from .schedule import Scheduler
+from .ratelimit import HostLimiter, retry_after, backoff
+from .stats import Stats
+from .links import (
+    extract_links, clean_url, can_add, 
+    normalize_link, compile_patterns, digest)
+from sqlalchemy import Integer, Text, Float
 import threading
-import base64
-from tldextract import extract
-import urllib.parse
-from bs4 import BeautifulSoup
+import asyncio
+import signal
+import sys
+import time
 import requests
 import logging
 import os
-import re
 
+# a debug line per request costs, CRONUS_LOG_LEVEL=DEBUG brings them back
 logging.basicConfig(format='[%(levelname)s] : [%(asctime)s] : %(message)s', datefmt='%d-%b-%y %H:%M:%S', 
-                    level=logging.DEBUG)
+                    level=os.environ.get("CRONUS_LOG_LEVEL", "INFO"))
 
 URL_TABLE = ("url",
     [   
         {"name" : "id", "type" : Integer, "unique":True, "nullable":False, "primary_key":True},
         {"name" : "url", "type" : Text, "unique":True},
-        {"name" : "state","type" : Integer}
+        {"name" : "state","type" : Integer},
+        {"name" : "etag","type" : Text},
+        {"name" : "modified","type" : Text},
+        {"name" : "hash","type" : Text},
+        {"name" : "interval","type" : Float},
+        {"name" : "next_visit","type" : Float},
+        {"name" : "retries","type" : Integer}
     ]
 )
 
+# url states
+NEW     = 0 # waiting to be crawled
+SKIPPED = 1 # matches a `pass` pattern, never crawled
+CRAWLED = 2 # crawled, visited again from `next_visit` on
+RECENT  = 3 # a `recent` section, polled by `add_recent`
+FAILED  = 4 # gave up on it
+RETRY   = 5 # failed, tried again from `next_visit` on
+
+HEADERS = {
+    'Accept': '*/*',
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'}
+
 global_lock = threading.Lock()
 
 class Cronus:
@@ -33,6 +59,27 @@ class Cronus:
         :param pass: links to reject (out of scope)
         :param seed: links to start with
         :param limit_urls: Amount of urls to crawl at a time
+        :param concurrency: Max open connections for :meth:`run_async`
+        :param per_host: Max open connections per host for :meth:`run_async`
+        :param parse_workers: Parser processes for :meth:`run_async`, 0 parses in-process
+        :param timeout: Seconds allowed for a single request
+        :param rate: Requests per second per host, unlimited by default so
+                     :class:`AdaptiveConcurrency` sets the pace
+        :param burst: Requests a host can get back to back
+        :param max_retries: Attempts before a failing url is given up on
+        :param backoff: Seconds before the first retry, doubled every attempt
+        :param penalty: Seconds a host is left alone after a 429/5xx without `Retry-After`
+        :param stats_port: Serve crawler stats as json on this port
+        :param recent_every: Seconds between checks for due `recent` sections in :meth:`run_forever`
+        :param recrawl: :class:`Scheduler` options for crawled pages
+        :param recent_recrawl: :class:`Scheduler` options for `recent` sections
+        :param bloom: Remember seen urls across runs in an on-disk bloom filter
+        :param bloom_capacity: Expected amount of urls for the bloom filter
+        :param bloom_save_every: Seconds between saves of the bloom filter,
+                                 it's saved on shutdown too
+        :param sqlite_pragmas: Overrides for :data:`cronus.db.SQLITE_PRAGMAS`
+        :param store: `files` (a file per page in `site/`) or `segments`
+                      (compressed pages packed in `segments/`)
         """
 
         logging.debug('Instantiating Cronus')
@@ -41,19 +88,48 @@ class Cronus:
         if not all(map(lambda x:x in config, fields)):    
             raise Exception("Expected these arguements: %s" % (fields))
 
-        self._pass = [re.compile(r) for r in config.get("pass", [])]
+        self._pass = compile_patterns(config.get("pass", []))
         self.url   = None
         self.seed  = config.get("seed")
         self.working_dir = config.get("working_dir")
         self.site_data   = os.path.join(self.working_dir, "site")
+        self.segment_data = os.path.join(self.working_dir, "segments")
+        self.store_type  = config.get("store", "files")
         self.db_path     = os.path.join(self.working_dir, "url.db")
+        self.bloom_path  = os.path.join(self.working_dir, "seen.bloom")
+        self.bloom       = config.get("bloom", False)
+        self.bloom_capacity = config.get("bloom_capacity", 5000000)
+        self.bloom_save_every = config.get("bloom_save_every", 300)
+        self.sqlite_pragmas = config.get("sqlite_pragmas")
         self.recent  = config.get("recent",[])        
         self.limit_urls  = config.get("limit_urls", 10)
+        self.concurrency = config.get("concurrency", 100)
+        self.per_host    = config.get("per_host", 10)
+        self.parse_workers = config.get("parse_workers", 0)
+        self.limiter     = HostLimiter(config.get("rate"), config.get("burst", 10))
+        self.timeout     = config.get("timeout", 30)
+        self.max_retries = config.get("max_retries", 5)
+        self.backoff     = config.get("backoff", 60)
+        self.penalty     = config.get("penalty", 30)
+        self.stats       = Stats()
+        self.stats_path  = os.path.join(self.working_dir, "stats.json")
+        self.headers     = config.get("headers", HEADERS)
+        self.recent_every = config.get("recent_every", 60)
+        self.scheduler    = Scheduler(**config.get("recrawl", {}))
+        self.recent_scheduler = Scheduler(**config.get("recent_recrawl", 
+                                    {"initial":600, "minimum":60, "maximum":6 * 3600}))
         self.new_links = []
+        self.found     = [] # links normalized by the parser processes
+        self.crawled   = []
+        self.validators = {} # url -> validators from the table
+        self.fetched    = {} # url -> validators of this batch
+        self.retrying   = {} # url -> state/retries/next_visit of failed urls
+        self._recent_at = 0
+        self._stopping  = None
         self.init_db()
 
-        self.crawled = []
-        self._urls     = []
+        if config.get("stats_port"):
+            self.stats.serve(config.get("stats_port"))
 
     def run(self):
         """
@@ -77,7 +153,102 @@ class Cronus:
         for t in tasks:
             t.join()
         
-        self.save_all()
+        self.checkpoint(final=True)
+
+    def run_async(self):
+        """
+        Same as :meth:`run` but fetches on an event loop with
+        pooled keep-alive connections instead of a thread per url
+        """
+
+        logging.debug('Add url tasks (async)')
+
+        seed_urls = [url.get("url") for url in self.get_urls()]
+
+        engine = AsyncEngine(self, concurrency=self.concurrency,
+                                per_host=self.per_host,
+                                timeout=self.timeout,
+                                parse_workers=self.parse_workers)
+        engine.run(seed_urls)
+
+        self.checkpoint(final=True)
+
+    def run_forever(self, pause=5):
+        """
+        Keeps crawling batches of `limit_urls` in one process, so
+        the db connection, frontier and seen urls stay warm between
+        batches. Every finished batch is checkpointed; SIGINT/SIGTERM
+        lets the current batch finish, checkpoints and returns
+
+        :param pause: seconds to wait when the frontier is empty
+        """
+
+        logging.debug('Starting crawler daemon')
+
+        asyncio.run(self._run_forever(pause))
+
+        logging.debug('Crawler daemon stopped')
+
+    def stop(self):
+        """
+        Asks :meth:`run_forever` to stop after the current batch
+        """
+        if self._stopping is not None:
+            self._stopping.set()
+
+    async def _run_forever(self, pause):
+        loop = asyncio.get_running_loop()
+        self._stopping = asyncio.Event()
+
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            loop.add_signal_handler(sig, self.stop)
+
+        engine = AsyncEngine(self, concurrency=self.concurrency,
+                                per_host=self.per_host,
+                                timeout=self.timeout,
+                                parse_workers=self.parse_workers)
+        try:
+            while not self._stopping.is_set():
+                if time.time() - self._recent_at >= self.recent_every:
+                    await self._add_recent_async(engine)
+
+                seed_urls = [url.get("url") for url in self.get_urls()]
+
+                if seed_urls:
+                    await engine.crawl(seed_urls)
+
+                self.checkpoint()
+
+                if not seed_urls:
+                    try:
+                        await asyncio.wait_for(self._stopping.wait(), pause)
+                    except asyncio.TimeoutError:
+                        pass
+        finally:
+            for sig in (signal.SIGINT, signal.SIGTERM):
+                loop.remove_signal_handler(sig)
+
+            await engine.close()
+            self.checkpoint(final=True)
+
+    def checkpoint(self, final=False):
+        """
+        Persists everything gathered so far and starts
+        a fresh batch
+
+        :param final: the last checkpoint before stopping, see :meth:`save_all`
+        """
+
+        self.save_all(final)
+
+        self.crawled   = []
+        self.new_links = []
+        self.found     = []
+        self.fetched   = {}
+        self.retrying  = {}
+        self.validators = {
+            url : self.validators[url] for url in self.recent if url in self.validators
+        }
             
     def init_db(self):
         """
@@ -89,46 +260,103 @@ class Cronus:
         if not os.path.exists(self.working_dir):
             os.makedirs(self.working_dir)
 
-        if not os.path.exists(self.site_data):
-            os.makedirs(self.site_data)
+        if self.store_type == "segments":
+            self.store = SegmentStore(self.segment_data)
+        else:
+            self.store = FileStore(self.site_data)
     
-        self.db  = DB("sqlite:///%s" % (self.db_path))
+        self.db  = DB("sqlite:///%s" % (self.db_path), pragmas=self.sqlite_pragmas)
         self.db.create_table(*URL_TABLE)
         self.url = self.db.table("url")
+        for field in URL_TABLE[1]:
+            self.url.add_column(field)
+        self.url.create_index("ix_url_state", "state")
+        self.url.create_index("ix_url_state_visit", "state", "next_visit")
+
+        self.seen = SeenURLs(self.bloom_path if self.bloom else None,
+                                capacity=self.bloom_capacity,
+                                save_every=self.bloom_save_every)
+
+        if self.bloom and not self.seen.loaded:
+            logging.debug('Building bloom filter from url table')
+            rows = self.url.select().execute()
+            self.seen.warm(row["url"] for row in rows)
 
         for url in self.seed:
-            self.add_url([{"url":url, "state":0}])
+            self.add_url([{"url":url, "state":NEW}])
+
+        self.url.insertmany(*[{"url":url, "state":RECENT} for url in self.recent], ignore=True)
+        self.url.updatemany("url", self.recent, state=RECENT)
+        self.load_validators(self.recent)
         
         self.add_recent()
 
-    def add_recent(self):
-        headers = {
-            'Accept': '*/*',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'}
+    def due_recent(self):
+        """
+        `recent` sections whose next visit is due
+        """
+        now = time.time()
+        return [
+            url for url in self.recent 
+            if ((self.validators.get(url) or {}).get("next_visit") or 0) <= now
+        ]
 
+    def add_recent(self):
         if self.recent:
-            for url in self.recent:
+            for url in self.due_recent():
+                headers = dict(self.headers, **self.conditional_headers(url))
                 try:
-                    response = requests.get(url, headers=headers)
+                    response = requests.get(url, headers=headers, timeout=self.timeout)
                 except Exception:
-                    pass
+                    continue
 
                 logging.debug('[%s] Requesting' % (url))
 
-                soup = BeautifulSoup(response.text)
-                links = soup.select("a")
+                self.add_recent_links(url, response.status_code, 
+                                        response.text, response.headers)
+
+        self._recent_at = time.time()
+
+    async def _add_recent_async(self, engine):
+        for url in self.due_recent():
+            result = await engine.fetch(url, self.conditional_headers(url))
+            if result is not None:
+                self.add_recent_links(url, *result)
+
+        self._recent_at = time.time()
+
+    def add_recent_links(self, url, status, html, headers=None):
+        """
+        Queues the links of a `recent` section. The section counts
+        as changed only if it lists links that hadn't been seen
+        """
+        if status != 304 and status not in range(200,300):
+            return
+
+        if not self.changed(url, status, html, headers):
+            logging.debug('[%s] Unchanged <%s>' % (url, status))
+            return
+
+        fresh = 0
+        for href in self.get_links(html, url):
+            href = self.clean_url(href)
+            if href and self.can_add(href):
+                # print(url, href)
+                self.new_links.append((url, href))
+
+                # out of scope links never make it to `seen`
+                href = normalize_link(url, href, self._pass)
+                fresh += href is not None and href not in self.seen
+
+        self.schedule(url, fresh > 0)
 
-                for a in links: 
-                    href = a.attrs.get("href")
-                    if href:
-                        href = self.clean_url(href)
-                        if self.can_add(href):
-                            # print(url, href)
-                            self.new_links.append((url, href))
     def get_urls(self):
         """
         Gathers links to crawl from the table
-        if they've not been crawled
+        if they've not been crawled, newest first
+
+        Links matching a `pass` pattern (added before the pattern was)
+        are marked `SKIPPED` on the way so they're never read again
 
         :param limit: amount of links to return
 
@@ -138,35 +366,145 @@ class Cronus:
 
         logging.debug('Gathering [%s] seed urls' % (limit))
 
-        filters = [("state","==",0)] 
-        results  = (
-            self.url.select()
-            .where(*filters)
-            .execute()
-        )
-        results = list(results)
-        print("################################ {} URLS ##########################".format(len(results)))
         result = []
-        i = 0
-        for row in results[::-1]:
-            url = dict(row.items())
-            if self.can_add(url.get('url')):
-                result.append(url)
-                i += 1
-
-            if i >= limit:
+
+        if not self.url.prepared("frontier"):
+            (
+                self.url.select()
+                .where(("state","==",NEW), ("id","<",param("before")))
+                .order_by("id", desc=True)
+                .limit(param("limit"))
+                .prepare("frontier")
+            )
+
+        if not self.url.prepared("due"):
+            (
+                self.url.select()
+                .where(("state","in",[CRAWLED, RETRY]), ("next_visit","<=",param("now")))
+                .order_by("next_visit")
+                .limit(param("limit"))
+                .prepare("due")
+            )
+
+        # pages due for a revisit or retry get up to half the batch
+        rows = self.url.run("due", {"now": time.time(), "limit": limit // 2})
+        for url in rows:
+            url = dict(url.items())
+            result.append(url)
+            self.validators[url.get('url')] = url
+
+        # rows that are read stay NEW until the batch is saved, every
+        # read carries on below the lowest id read so far
+        before = sys.maxsize
+        while len(result) < limit:
+            rows = self.url.run("frontier", {"limit": limit - len(result), "before": before})
+            rows = [dict(row.items()) for row in rows]
+
+            skipped = []
+            for url in rows:
+                before = min(before, url.get('id'))
+
+                if self.can_add(url.get('url')):
+                    result.append(url)
+                    self.validators[url.get('url')] = url
+                else:
+                    skipped.append(url.get('url'))
+
+            if not skipped:
                 break
 
-        #result = [ dict(row.items()) for i, row in enumerate(result) if i < limit ]
+            self.update_urls(skipped, state=SKIPPED)
 
         return result
 
-    def can_add(self, url):
-        for regex in self._pass:
-            if regex.fullmatch(url):
-                return False
+    def load_validators(self, urls):
+        """
+        Reads the stored etag/last-modified/hash of `urls`
+        """
+        rows = self.url.select().where(("url", "in", list(urls))).execute()
+
+        for row in rows:
+            row = dict(row.items())
+            self.validators[row.get("url")] = row
+
+    def conditional_headers(self, url):
+        """
+        `If-None-Match`/`If-Modified-Since` headers for `url` if
+        it has been fetched before
+        """
+        old = self.validators.get(url) or {}
+        headers = {}
 
-        return True
+        if old.get("etag"):
+            headers["If-None-Match"] = old.get("etag")
+        if old.get("modified"):
+            headers["If-Modified-Since"] = old.get("modified")
+
+        return headers
+
+    def changed(self, url, status, html, headers=None, sha1=None):
+        """
+        Keeps the validators of a response to store them with
+        the url, and tells whether the page changed since it was
+        last fetched
+
+        :return: `False` for a `304` or the same content hash
+        """
+        old = self.validators.get(url) or {}
+
+        if status == 304:
+            self.fetched[url] = {k : old.get(k) for k in ("etag", "modified", "hash")}
+            changed = False
+        else:
+            headers = headers or {}
+            sha1    = sha1 or digest(html)
+
+            self.fetched[url] = {
+                "etag"     : headers.get("ETag"),
+                "modified" : headers.get("Last-Modified"),
+                "hash"     : sha1
+            }
+            changed = sha1 != old.get("hash")
+
+        self.schedule(url, changed)
+
+        return changed
+
+    def schedule(self, url, changed):
+        """
+        Sets when `url` should be fetched again, see :class:`Scheduler`
+        """
+        old = self.validators.get(url) or {}
+        scheduler = self.recent_scheduler if url in self.recent else self.scheduler
+
+        interval, next_visit = scheduler.next(old.get("interval"), changed)
+
+        self.fetched[url]["interval"]   = interval
+        self.fetched[url]["next_visit"] = next_visit
+        self.fetched[url]["retries"]    = 0
+
+    def retry(self, url, delay=None, permanent=False):
+        """
+        Puts a url that couldn't be fetched back in the frontier
+        to be tried again after a backoff, instead of marking it
+        crawled. Gives up after `max_retries` attempts
+
+        :param delay: seconds to wait, i.e from `Retry-After`
+        :param permanent: give up right away (i.e a 404)
+        """
+        old = self.validators.get(url) or {}
+        retries = (old.get("retries") or 0) + 1
+
+        if permanent or retries > self.max_retries:
+            logging.debug('[%s] Giving up after %s attempt(s)' % (url, retries))
+            self.retrying[url] = {"state": FAILED, "retries": retries, "next_visit": None}
+        else:
+            delay = delay or backoff(retries, self.backoff)
+            self.retrying[url] = {"state": RETRY, "retries": retries, 
+                                    "next_visit": time.time() + delay}
+
+    def can_add(self, url):
+        return can_add(url, self._pass)
     
     def _add_url(self, *new_urls):
         """
@@ -177,41 +515,27 @@ class Cronus:
         """
         urls = []
         for origin, url in new_urls:
-            url = url.strip()
-
-            if not url.startswith("#"):
-                if url.startswith("/"):
-                    u = urllib.parse.urlparse(origin)
-                    addon = u.netloc
-
-                    if u.scheme:
-                        addon = u.scheme+"://"+addon
-
-                    url = addon + url
-
-                url = self.clean_url(url)
-                if not url:
-                    continue
-
-                eu = extract(url)
-                o_eu = extract(origin)
-
-                if eu.domain == o_eu.domain and self.can_add(url):
-                    if url not in self._urls:
-                        self._urls.append(url)
-                        urls.append({"url":url, "state":0})
+            url = normalize_link(origin, url, self._pass)
 
+            if url and self.seen.add(url):
+                urls.append({"url":url, "state":NEW})
         
         return urls
+
+    def _add_found(self, found):
+        """
+        Same as :meth:`_add_url` for links normalized already
+        """
+        return [{"url":url, "state":NEW} for url in found if self.seen.add(url)]
     
     def add_url(self, urls):
         for url in urls:
-            try:
-                self.url.insert(**url)
-            except sqlalchemy.exc.IntegrityError:
-                pass
+            if not self.can_add(url.get("url")):
+                url["state"] = SKIPPED
+
+        self.url.insertmany(*urls, ignore=True)
 
-    def update_urls(self, urls, state=2):
+    def update_urls(self, urls, state=CRAWLED):
         """
         Signifies that a url has been crawled
 
@@ -219,39 +543,14 @@ class Cronus:
         :param state: an integer that signifies that a link 
                       has been crawled
         """
-        
-        for url in urls:
-            filters = [("url", "==", url)]
 
-            (
-                self.url.update()
-                .where(*filters)
-                .values(state=state)
-                .execute()
-            )
+        self.url.updatemany("url", urls, state=state)
 
     def clean_url(self, url):
         """
-        Removes query parameters for url i.e `ID` and `query-parameters`
-        target
-
-        Note: since we'd only crawl specific sites it's neccessary
-
-        Example:
-        --------
-        >>> clean_url('https://www.example.com#abc?a=b')
-        >>> 'https://www.example.com'
-
-        :return: new url `string`
+        See :func:`cronus.links.clean_url`
         """
-        try:
-            out =  urllib.parse.urljoin(
-                url, urllib.parse.urlparse(url).path
-            )
-        except Exception as err:
-            return None
-
-        return out
+        return clean_url(url)
 
     def save_url(self, url):
         """
@@ -263,43 +562,85 @@ class Cronus:
         #    return
 
         response = None
-        
-        headers = {
-            'Accept': '*/*',
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.114 Safari/537.36'}
+        headers  = dict(self.headers, **self.conditional_headers(url))
 
+        time.sleep(self.limiter.take(url))
+
+        start = time.monotonic()
         try:
-            response = requests.get(url, headers=headers)
+            response = requests.get(url, headers=headers, timeout=self.timeout)
         except requests.exceptions.InvalidSchema:
             self.crawled.append(url)
         except requests.exceptions.MissingSchema:
             self.crawled.append(url)
+        except requests.exceptions.RequestException as err:
+            self.stats.incr("errors.%s" % type(err).__name__)
+            self.retry(url)
             
         logging.debug('[%s] Requesting' % (url))
 
 
-        if response:
-            if response.status_code in range(200,300):
-                logging.debug('[%s] Requesting succeeded <%s>' % (url, response.status_code))
+        if response is not None:
+            self.stats.observe("fetch", time.monotonic() - start)
+            self.stats.incr("status.%s" % response.status_code)
+            self.stats.incr("bytes", len(response.content))
+            self.stats.incr("pages")
+
+            if response.status_code == 429 or response.status_code >= 500:
+                self.limiter.pause(url, retry_after(response.headers) or self.penalty)
+
+            self.process(url, response.status_code, response.text, response.headers)
+
+    def process(self, url, status, html, headers=None, parsed=None):
+        """
+        Handles a fetched page, whichever way it was fetched.
+        Unchanged pages are only marked crawled, they're not stored
+        again so they aren't re-extracted or re-indexed
 
-                soup = BeautifulSoup(response.text)
-                links = soup.select("a")
+        :param url: requested url
+        :param status: http status code of the response
+        :param html: text/html data
+        :param headers: response headers
+        :param parsed: result of :func:`cronus.links.parse_page` if
+                       the page went through a parser process
+        """
+        sha1 = parsed[0] if parsed else None
 
-                more_urls = []
+        if (status == 304 or status in range(200,300)) and \
+                not self.changed(url, status, html, headers, sha1):
+            logging.debug('[%s] Unchanged <%s>' % (url, status))
+            self.crawled.append(url)
 
-                for a in links: 
-                    href = a.attrs.get("href")
-                    if href:
-                        more_urls.append(href)
-                
-                self.save(url=url, html=response.text, more_urls=more_urls)
+        elif status in range(200,300):
+            logging.debug('[%s] Requesting succeeded <%s>' % (url, status))
 
-                #elif response.status_code in range(500,600):
-                #pass
+            if parsed:
+                self.save(url=url, html=html, found=parsed[1])
             else:
-                self.crawled.append(url)
+                with self.stats.timer("parse"):
+                    more_urls = self.get_links(html, url)
+                self.save(url=url, html=html, more_urls=more_urls)
+
+        elif status in (408, 429) or status >= 500:
+            logging.debug('[%s] Requesting failed <%s>' % (url, status))
+            self.retry(url, retry_after(headers))
+
+        elif status >= 400:
+            logging.debug('[%s] Requesting failed <%s>' % (url, status))
+            self.retry(url, permanent=True)
+
+        else:
+            self.crawled.append(url)
+
+    def get_links(self, html, base_url=None):
+        """
+        Gathers the `href` of every anchor in `html`, resolved
+        against `base_url`, see :func:`cronus.links.extract_links`
+        """
+
+        return extract_links(html, base_url)
             
-    def save(self, url, html,more_urls=[]):
+    def save(self, url, html,more_urls=[], found=[]):
         """
         Saves downoad html data and save new
         urls to be crawled
@@ -307,41 +648,56 @@ class Cronus:
         :param url: crawled url
         :param html: text/html data
         :param more_urls: New urls to be crawled
+        :param found: New urls to be crawled, normalized already
         """
 
         logging.debug('[%s] Saving html data' % (url))
 
         for u in more_urls: 
             self.new_links.append((url, u))
+
+        self.found.extend(found)
         
         self.crawled.append(url)
 
-        eu = extract(url)
-        fp = os.path.join(self.site_data, eu.domain)
-
-        if not os.path.exists(fp):
-            os.mkdir(fp)
+        with self.stats.timer("store"):
+            self.store.put(url, html)
 
-        fn = base64.b64encode(url.encode("UTF-8"))
-        fn = fn.decode("UTF-8")
+    def save_all(self, final=False):
+        """
+        :param final: save the bloom filter even if it isn't due
+        """
+        logging.debug('Saving all!!!!')
 
-        filename = os.path.join(fp, fn)
-        
-        with open(filename, "w", encoding="UTF-8", errors="ignore") as fp:
-            fp.write(html)
+        # pages are on disk before they're marked crawled
+        with self.stats.timer("store.flush"):
+            self.store.flush()
 
-    def save_all(self):
-        print("------------------------------------------------------------")
-        logging.debug('Saving all!!!!')
+        start = time.monotonic()
         
         self.update_urls(self.crawled)
+        self.url.updaterows("url", [
+            dict(validators, url=url) for url, validators in self.fetched.items()
+        ])
+        self.validators.update(self.fetched)
+        self.url.updaterows("url", [
+            dict(retrying, url=url) for url, retrying in self.retrying.items()
+        ])
 
         urls = self._add_url(*self.new_links)
+        urls += self._add_found(self.found)
         self.add_url(urls)
 
         self.db.session.commit()
+        self.seen.save(force=final)
+
+        self.stats.observe("db", time.monotonic() - start)
+        self.stats.incr("crawled", len(self.crawled))
+        self.stats.incr("new_urls", len(urls))
+        self.stats.incr("retrying", len(self.retrying))
+        self.stats.dump(self.stats_path)
 
-        logging.debug("Crawled: [%s]" % (len(self.crawled)))
-        logging.debug("New links: [%s]" % (len(self.new_links)))
+        logging.info("Crawled: [%s] New urls: [%s] Retrying: [%s]" % (
+            len(self.crawled), len(urls), len(self.retrying)))
 
  
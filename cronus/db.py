@@ -1,10 +1,11 @@
 from sqlalchemy import (
     create_engine, Table, Column, Integer, 
     Boolean, Date, DateTime, Float,
-    Text, Time, String, MetaData)
+    Text, Time, String, MetaData, Index, event, bindparam)
 
 from sqlalchemy.engine import reflection
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
+from sqlalchemy.pool import QueuePool
 
 
 DATA_TYPES = {
@@ -17,17 +18,78 @@ DATA_TYPES = {
     "datetime" : DateTime
 }
 
+# rows per statement for bulk operations, keeps
+# `IN (...)` under sqlite's bound parameter limit
+CHUNK_SIZE = 500
+
+def param(name, expanding=False):
+    """
+    Placeholder for a value given when a prepared statement
+    is run (see :meth:`_Table.prepare`), `expanding` takes a list
+    i.e for `in_`
+    """
+    return bindparam(name, expanding=expanding)
+
+def chunks(items, size=CHUNK_SIZE):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+
+    if chunk:
+        yield chunk
+
+# applied to every new sqlite connection, a `None`
+# value leaves sqlite's own default
+SQLITE_PRAGMAS = {
+    "journal_mode" : "WAL",
+    "synchronous"  : "NORMAL",
+    "mmap_size"    : 256 * 1024 * 1024,
+    "cache_size"   : -64000, # in KiB when negative
+    "busy_timeout" : 10000,  # ms
+    "temp_store"   : "MEMORY"
+}
+
 class DB:
 
-    def __init__(self, db, echo=False):
-        self.engine = create_engine(db, echo=echo, connect_args={'check_same_thread': False})
+    def __init__(self, db, echo=False, pragmas=None, pool_size=5):
+        """
+        :param db: database url
+        :param echo: log every statement
+        :param pragmas: overrides for :data:`SQLITE_PRAGMAS`
+        :param pool_size: connections kept open for the sessions
+        """
+        self.engine = create_engine(db, echo=echo, connect_args={'check_same_thread': False},
+                                    poolclass=QueuePool, pool_size=pool_size)
+        self.pragmas = dict(SQLITE_PRAGMAS, **(pragmas or {}))
+
+        if self.engine.dialect.name == "sqlite":
+            event.listen(self.engine, "connect", self._set_pragmas)
+
         self.meta   = MetaData()
         self._connection = None
         self.inspector   = reflection.Inspector.from_engine(self.engine)
         self.load_tables()
 
-        Session = sessionmaker(bind=self.engine)
-        self.session = Session()
+        # one session per thread, used through the same
+        # `self.session.execute(...)` / `.commit()` calls
+        self.session = scoped_session(sessionmaker(bind=self.engine))
+
+    def _set_pragmas(self, dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in self.pragmas.items():
+            if value is not None:
+                cursor.execute("PRAGMA %s = %s" % (name, value))
+        cursor.close()
+
+    def remove_session(self):
+        """
+        Closes the calling thread's session, call it
+        before a worker thread exits
+        """
+        self.session.remove()
 
     @property
     def connection(self):
@@ -136,12 +198,53 @@ class QueryBuilder:
                 self.stmt = self.stmt.where(column < value)
             elif op == "<=":
                 self.stmt = self.stmt.where(column <= value)
+            elif op == "in":
+                self.stmt = self.stmt.where(column.in_(value))
             
         return self
+
+    def order_by(self, column, desc=False):
+        column = self.columns.get(column)
+        self.stmt = self.stmt.order_by(column.desc() if desc else column)
+        return self
+
+    def limit(self, n):
+        self.stmt = self.stmt.limit(n)
+        return self
     
     def execute(self):
         return self.db.session.execute(self.stmt)
 
+    def prepare(self, name):
+        """
+        Keeps the statement built so far as `name`. Build it
+        with :func:`param` placeholders and run it again and again
+        with :meth:`run`, it's then built and compiled to SQL once
+        instead of every time
+
+        Example:
+        --------
+        >>> table.select().where(("url", "==", param("url"))).prepare("by_url")
+        >>> table.run("by_url", {"url": "https://www.nairaland.com/"})
+        """
+        self.statements[name] = self.stmt
+        return self
+
+    def prepared(self, name):
+        return name in self.statements
+
+    def run(self, name, params=None):
+        """
+        Executes prepared statement `name`
+
+        :param params: dict of values, or a list of dicts (executemany)
+        """
+        # sqlalchemy only keeps compiled statements around
+        # when given a `compiled_cache` to keep them in
+        connection = self.db.session.connection().execution_options(
+                        compiled_cache=self.compiled)
+        return connection.execute(self.statements[name], params or {})
+
 
 class _Table(QueryBuilder):
 
@@ -149,35 +252,137 @@ class _Table(QueryBuilder):
         self.db      = db
         self.name    = name
         self.table   = db.meta.tables[name]
+        self.statements = {}
+        self.compiled   = {} # see `run`
+        self._columns   = None
 
         super().__init__()
 
     @property
     def columns(self):
-        return { c.name : c for c in self.table.columns }
+        if self._columns is None:
+            self._columns = { c.name : c for c in self.table.columns }
+
+        return self._columns
 
     def get_column(self, name):
         return self.columns.get(name)
 
+    def create_index(self, name, *columns):
+        """
+        Creates index `name` over `columns` unless
+        the table already has it
+        """
+        indexes = self.db.inspector.get_indexes(self.name)
+
+        if name not in [index.get("name") for index in indexes]:
+            index = Index(name, *[self.columns[c] for c in columns])
+            index.create(self.db.engine)
+
+            return index
+
     def insert(self, *args, **kwargs):
         ins = self.table.insert()
         ins = ins.values(**kwargs)
 
         self.db.session.execute(ins)
     
-    def insertmany(self, *args):
-        ins = self.table.insert()
-        ins = ins.values(*args)
-        
-        self.db.session.execute(ins)
-    
+    def insertmany(self, *rows, ignore=False, chunk_size=CHUNK_SIZE, commit=False):
+        """
+        Inserts `rows` with one executemany per chunk
+
+        :param rows: dicts, all with the same keys
+        :param ignore: skip rows that break a unique constraint (`INSERT OR IGNORE`)
+        :param chunk_size: rows per statement
+        :param commit: commit after every chunk instead of leaving it to the caller
+        """
+        name = ("insertmany", ignore)
+
+        if not self.prepared(name):
+            ins = self.table.insert()
+            if ignore:
+                ins = ins.prefix_with("OR IGNORE")
+
+            self.statements[name] = ins
+
+        for chunk in chunks(rows, chunk_size):
+            self.run(name, chunk)
+            if commit:
+                self.db.session.commit()
+
+    def updatemany(self, column, keys, chunk_size=CHUNK_SIZE, commit=False, **values):
+        """
+        Sets `values` on every row whose `column` is in `keys`,
+        i.e `UPDATE ... SET ... WHERE column IN (...)` per chunk
+
+        :param column: key column name
+        :param keys: list of key values
+        :param chunk_size: keys per statement
+        :param commit: commit after every chunk instead of leaving it to the caller
+        """
+        name = ("updatemany", column, tuple(sorted(values)))
+
+        if not self.prepared(name):
+            (
+                self.update()
+                .where((column, "in", param("keys", expanding=True)))
+                .values(**{ k : param("value_" + k) for k in values })
+                .prepare(name)
+            )
+
+        params = { "value_" + k : v for k, v in values.items() }
+
+        for chunk in chunks(keys, chunk_size):
+            self.run(name, dict(params, keys=chunk))
+            if commit:
+                self.db.session.commit()
+
+    def updaterows(self, column, rows, chunk_size=CHUNK_SIZE, commit=False):
+        """
+        Updates every row whose `column` equals `row[column]` with
+        the other values of `row`, one executemany per chunk
+
+        :param column: key column name
+        :param rows: dicts, all with the same keys
+        :param chunk_size: rows per statement
+        :param commit: commit after every chunk instead of leaving it to the caller
+        """
+        rows = list(rows)
+        if not rows:
+            return
+
+        keys = tuple(sorted(k for k in rows[0] if k != column))
+        name = ("updaterows", column, keys)
+
+        if not self.prepared(name):
+            (
+                self.update()
+                .where((column, "==", param("key")))
+                .values(**{ k : param("value_" + k) for k in keys })
+                .prepare(name)
+            )
+
+        for chunk in chunks(rows, chunk_size):
+            params = [
+                dict({ "value_" + k : row[k] for k in keys }, key=row[column])
+                for row in chunk
+            ]
+            self.run(name, params)
+            if commit:
+                self.db.session.commit()
+
     def add_column(self, field):
         column = self.db._column_from_dict(field)
-        column_name = column.compile(dialect=self.db.engine.dialect)
+        column_name = column.name
         
-        if self.get_column(column_name) is not None:
+        if self.get_column(column_name) is None:
             column_type = column.type.compile(self.db.engine.dialect)
         
             self.db.engine.execute('ALTER TABLE %s ADD COLUMN %s %s' % (self.name, column_name, column_type))
 
+            self.table.append_column(column)
+            self._columns   = None
+            self.statements = {}
+            self.compiled   = {}
+
             return column
@@ -0,0 +1,160 @@
+import hashlib
+import math
+import os
+import struct
+import time
+
+
+HEADER = struct.Struct("<QII")
+
+
+def fingerprint(url):
+    """
+    128 bit digest used in place of the url itself
+    """
+    return hashlib.blake2b(url.encode("UTF-8"), digest_size=16).digest()
+
+
+class BloomFilter:
+
+    def __init__(self, capacity=1000000, error_rate=0.001):
+        """
+        Fixed size set of fingerprints, answers "maybe seen" or
+        "definitely not seen"
+
+        :param capacity: expected amount of items
+        :param error_rate: chance of a false "maybe seen" at `capacity`
+        """
+
+        self.size   = int(math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.count  = 0
+        self.bits   = bytearray((self.size + 7) // 8)
+
+    def _positions(self, fp):
+        h1 = int.from_bytes(fp[:8], "little")
+        h2 = int.from_bytes(fp[8:], "little") | 1
+
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def add(self, fp):
+        for pos in self._positions(fp):
+            self.bits[pos >> 3] |= 1 << (pos & 7)
+
+        self.count += 1
+
+    def __contains__(self, fp):
+        for pos in self._positions(fp):
+            if not self.bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+
+        return True
+
+    def save(self, path):
+        tmp = path + ".tmp"
+
+        with open(tmp, "wb") as fp:
+            fp.write(HEADER.pack(self.size, self.hashes, self.count))
+            fp.write(self.bits)
+            fp.flush()
+            os.fsync(fp.fileno())
+
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        bloom = cls.__new__(cls)
+
+        with open(path, "rb") as fp:
+            bloom.size, bloom.hashes, bloom.count = HEADER.unpack(fp.read(HEADER.size))
+            bloom.bits = bytearray(fp.read())
+
+        return bloom
+
+
+class SeenURLs:
+
+    def __init__(self, path=None, capacity=1000000, error_rate=0.001, save_every=300):
+        """
+        Remembers urls that have been queued already
+
+        Fingerprints seen by this process are kept in a set; with
+        `path`, they also go into a bloom filter saved to disk so the
+        next run knows them too. A bloom false positive drops a new url,
+        keep `capacity` above the size of the url table
+
+        The whole filter is rewritten on a save, so it's only saved
+        every `save_every` seconds. Urls added since the last save
+        are just queued again after a crash, the url table ignores
+        them
+
+        :param path: bloom filter file, `None` to keep memory only
+        :param capacity: see :class:`BloomFilter`
+        :param error_rate: see :class:`BloomFilter`
+        :param save_every: seconds between saves of the filter
+        """
+
+        self.path   = path
+        self.bloom  = None
+        self.loaded = False
+        self.save_every = save_every
+        self._seen  = set()
+        self._dirty = False
+        self._saved = time.monotonic()
+
+        if path:
+            if os.path.exists(path):
+                self.bloom  = BloomFilter.load(path)
+                self.loaded = True
+            else:
+                self.bloom = BloomFilter(capacity, error_rate)
+
+    def __contains__(self, url):
+        fp = fingerprint(url)
+        return fp in self._seen or (self.bloom is not None and fp in self.bloom)
+
+    def __len__(self):
+        return len(self._seen)
+
+    def add(self, url):
+        """
+        :return: `True` if `url` hadn't been seen before
+        """
+        fp = fingerprint(url)
+
+        if fp in self._seen or (self.bloom is not None and fp in self.bloom):
+            return False
+
+        self._seen.add(fp)
+
+        if self.bloom is not None:
+            self.bloom.add(fp)
+            self._dirty = True
+
+        return True
+
+    def warm(self, urls):
+        """
+        Fills the bloom filter with `urls` already known
+        from elsewhere i.e the url table
+        """
+        if self.bloom is not None:
+            for url in urls:
+                self.bloom.add(fingerprint(url))
+                self._dirty = True
+
+    def save(self, force=False):
+        """
+        Saves the bloom filter if it changed and `save_every`
+        seconds went by since the last save
+
+        :param force: save whenever it changed, i.e on shutdown
+        """
+        if self.bloom is None or not self._dirty:
+            return
+
+        if force or time.monotonic() - self._saved >= self.save_every:
+            self.bloom.save(self.path)
+            self._dirty = False
+            self._saved = time.monotonic()
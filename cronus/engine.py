@@ -0,0 +1,233 @@
+from concurrent.futures import ProcessPoolExecutor
+import asyncio
+import logging
+import time
+
+import aiohttp
+
+from .links import init_parser, parse_page
+from .ratelimit import AdaptiveConcurrency, retry_after
+
+
+class AsyncEngine:
+
+    def __init__(self, crawler, concurrency=100, per_host=10,
+                    timeout=30, queue_size=100, parse_workers=0):
+        """
+        Fetches urls on a single event loop, sharing one pool of
+        keep-alive connections, and hands the pages over to the
+        crawler while other fetches are still in flight
+
+        Requests go through the crawler's per host rate limiter and
+        an :class:`AdaptiveConcurrency` limit that backs off on errors
+        and slow responses
+
+        :param crawler: the :class:`Cronus` instance that owns the pages
+        :param concurrency: max connections open at a time (all hosts)
+        :param per_host: max connections open at a time per host
+        :param timeout: seconds allowed for a single request
+        :param queue_size: max fetched pages waiting to be parsed
+        :param parse_workers: processes extracting and normalizing links,
+                              0 does it on the event loop
+        """
+
+        self.crawler     = crawler
+        self.concurrency = concurrency
+        self.per_host    = per_host
+        self.timeout     = timeout
+        self.queue_size  = queue_size
+        self.parse_workers = parse_workers
+        self.session     = None
+        self.pool        = None
+        self.controller  = AdaptiveConcurrency(initial=min(per_host, concurrency),
+                                                maximum=concurrency)
+
+        stats = crawler.stats
+        stats.gauge("concurrency.limit", lambda: int(self.controller.limit))
+        stats.gauge("concurrency.in_flight", lambda: self.controller.in_flight)
+
+    async def open(self):
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self.concurrency,
+                limit_per_host=self.per_host,
+                ttl_dns_cache=300)
+
+            self.session = aiohttp.ClientSession(
+                connector=connector,
+                headers=self.crawler.headers,
+                timeout=aiohttp.ClientTimeout(total=self.timeout))
+
+        if self.pool is None and self.parse_workers:
+            self.pool = ProcessPoolExecutor(self.parse_workers,
+                            initializer=init_parser, 
+                            initargs=(self.crawler._pass,))
+
+        return self.session
+
+    async def close(self):
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    async def fetch(self, url, headers=None):
+        """
+        Requests `url` using the shared session
+
+        :param headers: extra request headers
+        :return: (status, html, response headers) or `None` if the request failed
+        """
+
+        session = await self.open()
+
+        wait = self.crawler.limiter.take(url)
+        if wait:
+            await asyncio.sleep(wait)
+
+        await self.controller.acquire()
+
+        logging.debug('[%s] Requesting' % (url))
+
+        stats = self.crawler.stats
+        start = time.monotonic()
+        error = True
+        try:
+            async with session.get(url, headers=headers) as response:
+                body  = await response.read()
+                html  = body.decode(response.get_encoding(), errors="ignore")
+                error = response.status == 429 or response.status >= 500
+
+                stats.observe("fetch", time.monotonic() - start)
+                stats.incr("status.%s" % response.status)
+                stats.incr("bytes", len(body))
+                stats.incr("pages")
+
+                if error:
+                    # the host is struggling or throttling us
+                    self.crawler.limiter.pause(url, retry_after(response.headers) 
+                                                    or self.crawler.penalty)
+
+                return response.status, html, response.headers
+        except (aiohttp.ClientError, asyncio.TimeoutError, ValueError) as err:
+            logging.debug('[%s] Requesting failed <%s>' % (url, err))
+            stats.incr("errors.%s" % type(err).__name__)
+        finally:
+            await self.controller.release(time.monotonic() - start, error)
+
+        return None
+
+    async def _fetcher(self, urls, pages):
+        while True:
+            try:
+                url = urls.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+
+            result = await self.fetch(url, self.crawler.conditional_headers(url))
+
+            if result is None:
+                self.crawler.retry(url)
+            else:
+                await pages.put((url,) + result)
+
+    async def _parse(self, page, slots):
+        loop = asyncio.get_running_loop()
+        url, status, html, headers = page
+
+        try:
+            with self.crawler.stats.timer("parse"):
+                parsed = await loop.run_in_executor(self.pool, parse_page, url, html)
+        except Exception as err:
+            logging.debug('[%s] Parsing failed <%s>' % (url, err))
+            parsed = None
+
+        try:
+            self._process(page, parsed)
+        finally:
+            slots.release()
+
+    def _process(self, page, parsed=None):
+        # a page that can't be handled (i.e the store is out of
+        # space) is tried again later, the other pages go on
+        try:
+            self.crawler.process(*page, parsed=parsed)
+        except Exception:
+            logging.exception('[%s] Processing failed' % (page[0]))
+            self.crawler.stats.incr("errors.process")
+            self.crawler.retry(page[0])
+
+    async def _parser(self, pages):
+        # with parser processes, at most two pages per process are
+        # in flight; the page queue then fills up and the fetchers
+        # wait on it until the parsers catch up
+        slots   = asyncio.Semaphore(max(1, self.parse_workers * 2))
+        parsing = set()
+
+        while True:
+            page = await pages.get()
+            if page is None:
+                break
+
+            if self.pool is None or page[1] not in range(200,300):
+                self._process(page)
+                continue
+
+            await slots.acquire()
+            task = asyncio.ensure_future(self._parse(page, slots))
+            parsing.add(task)
+            task.add_done_callback(parsing.discard)
+
+        if parsing:
+            await asyncio.gather(*parsing)
+
+    async def crawl(self, urls):
+        """
+        Fetches every url in `urls`; parsing runs alongside the
+        fetchers, which wait whenever `queue_size` pages are pending
+
+        :param urls: list of links to crawl
+        """
+
+        work = asyncio.Queue()
+        for url in urls:
+            work.put_nowait(url)
+
+        pages  = asyncio.Queue(maxsize=self.queue_size)
+
+        self.crawler.stats.gauge("queue.urls", work.qsize)
+        self.crawler.stats.gauge("queue.pages", pages.qsize)
+        parser = asyncio.ensure_future(self._parser(pages))
+
+        workers  = max(1, min(self.concurrency, len(urls)))
+        fetchers = asyncio.ensure_future(asyncio.gather(*[
+            self._fetcher(work, pages) for _ in range(workers)
+        ]))
+
+        try:
+            # the parser only stops before the fetchers on an error,
+            # the fetchers would then wait on a full queue forever
+            await asyncio.wait([fetchers, parser], return_when=asyncio.FIRST_COMPLETED)
+            if parser.done():
+                parser.result()
+
+            await fetchers
+            await pages.put(None)
+            await parser
+        finally:
+            for task in (fetchers, parser):
+                if not task.done():
+                    task.cancel()
+                    await asyncio.gather(task, return_exceptions=True)
+
+    def run(self, urls):
+        async def main():
+            try:
+                await self.crawl(urls)
+            finally:
+                await self.close()
+
+        asyncio.run(main())
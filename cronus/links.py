@@ -0,0 +1,220 @@
+from tldextract import extract
+from functools import lru_cache
+from html import unescape
+import urllib.parse
+import hashlib
+import re
+
+# `href` of an anchor tag, double, single or un-quoted. The
+# attribute has to follow whitespace so `data-href` isn't taken
+A_HREF = re.compile(
+    r"""<a\s(?:[^>]*?\s)?href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""",
+    re.IGNORECASE)
+
+BASE_HREF = re.compile(
+    r"""<base\s(?:[^>]*?\s)?href\s*=\s*(?:"([^"]*)"|'([^']*)'|([^\s"'>]+))""",
+    re.IGNORECASE)
+
+# markup whose anchors aren't links of the page, an unclosed
+# block runs to the end like it does in a browser
+SKIPPED = re.compile(
+    r"<!--.*?(?:-->|\Z)|<(script|style)\b.*?(?:</\1\s*>|\Z)",
+    re.IGNORECASE | re.DOTALL)
+
+
+def _href(match):
+    href = match.group(1)
+    if href is None:
+        href = match.group(2)
+    if href is None:
+        href = match.group(3)
+
+    return unescape(href.strip())
+
+def extract_links(html, base_url=None):
+    """
+    Gathers the `href` of every anchor in `html` by scanning the
+    markup for `<a ...>` tags, no DOM is built. Comments, scripts
+    and styles are skipped
+
+    :param html: text/html data
+    :param base_url: url of the page, links are resolved against
+                     it (or the page's `<base href>`) when given
+
+    :return: list of links
+    """
+    html = SKIPPED.sub(" ", html)
+
+    if base_url:
+        base = BASE_HREF.search(html)
+        if base:
+            base_url = urllib.parse.urljoin(base_url, _href(base))
+
+    links = []
+    for match in A_HREF.finditer(html):
+        href = _href(match)
+        if not href:
+            continue
+
+        if base_url:
+            href = urllib.parse.urljoin(base_url, href)
+
+        links.append(href)
+
+    return links
+
+
+def clean_url(url):
+    """
+    Removes query parameters for url i.e `ID` and `query-parameters`
+    target
+
+    Note: since we'd only crawl specific sites it's neccessary
+
+    Example:
+    --------
+    >>> clean_url('https://www.example.com#abc?a=b')
+    >>> 'https://www.example.com'
+
+    :return: new url `string`
+    """
+    try:
+        out =  urllib.parse.urljoin(
+            url, urllib.parse.urlparse(url).path
+        )
+    except Exception as err:
+        return None
+
+    return out
+
+# inline flags that apply to the whole pattern, i.e `(?i)`
+GLOBAL_FLAGS = re.compile(r"\(\?[aiLmsux]+\)")
+
+# flags a pattern keeps when it's scoped to its part of the join
+SCOPED_FLAGS = ((re.ASCII, "a"), (re.IGNORECASE, "i"), (re.MULTILINE, "m"),
+                (re.DOTALL, "s"))
+
+class PatternSet(tuple):
+    """
+    `pass` patterns that can't be joined, checked one by one
+    """
+    def fullmatch(self, url):
+        for pattern in self:
+            match = pattern.fullmatch(url)
+            if match:
+                return match
+
+def _scoped(pattern):
+    flags = "".join(c for flag, c in SCOPED_FLAGS if pattern.flags & flag)
+    return "(?%s:%s)" % (flags, pattern.pattern) if flags else "(?:%s)" % pattern.pattern
+
+def compile_patterns(patterns):
+    """
+    Joins the `pass` patterns (strings or compiled) into one
+    alternation so a url is checked against all of them with
+    a single match, each keeps its own flags
+
+    Patterns with groups (backreferences and group names only
+    make sense on their own), global inline flags or the
+    verbose flag are checked one by one instead
+
+    :return: compiled pattern or :class:`PatternSet`, `None` if
+             there are no patterns
+    """
+    patterns = [re.compile(p) for p in patterns]
+
+    if not patterns:
+        return None
+
+    if any(p.groups or p.flags & re.VERBOSE or GLOBAL_FLAGS.match(p.pattern)
+           for p in patterns):
+        return PatternSet(patterns)
+
+    try:
+        return re.compile("|".join(_scoped(p) for p in patterns))
+    except re.error:
+        return PatternSet(patterns)
+
+def can_add(url, pattern):
+    """
+    :param pattern: `pass` patterns from :func:`compile_patterns`,
+                    matching links are rejected
+    """
+    return pattern is None or not pattern.fullmatch(url)
+
+@lru_cache(maxsize=4096)
+def domain(host):
+    """
+    Domain name of `host` i.e `nairaland` for `www.nairaland.com`
+    """
+    return extract(host).domain
+
+@lru_cache(maxsize=4096)
+def _origin(origin):
+    u = urllib.parse.urlparse(origin)
+    addon = u.netloc
+
+    if u.scheme:
+        addon = u.scheme+"://"+addon
+
+    return addon, domain(u.netloc)
+
+@lru_cache(maxsize=262144)
+def _normalize(base, origin_domain, url, pattern):
+    if url.startswith("#"):
+        return None
+
+    if url.startswith("/"):
+        url = base + url
+
+    url = clean_url(url)
+    if not url:
+        return None
+
+    if domain(urllib.parse.urlparse(url).netloc) == origin_domain and can_add(url, pattern):
+        return url
+
+def normalize_link(origin, url, pattern=None):
+    """
+    Turns a link found on `origin` into the url that'd be
+    stored, or `None` if it's out of scope (another domain,
+    a fragment or matching a `pass` pattern)
+
+    Results are memoized, a page's navigation links and its
+    origin are only ever worked out once
+
+    :param pattern: `pass` patterns from :func:`compile_patterns`
+    """
+    base, origin_domain = _origin(origin)
+
+    return _normalize(base, origin_domain, url.strip(), pattern)
+
+def digest(html):
+    return hashlib.sha1(html.encode("UTF-8", errors="ignore")).hexdigest()
+
+
+# `pass` patterns of a parser process, see `init_parser`
+_PATTERN = None
+
+def init_parser(pattern):
+    """
+    Initializer for parser processes, sets the `pass` patterns once
+    instead of sending them with every page
+    """
+    global _PATTERN
+    _PATTERN = pattern
+
+def parse_page(url, html):
+    """
+    The CPU bound part of handling a fetched page, meant to
+    run in a parser process
+
+    :return: (content digest, normalized in-scope links)
+    """
+    links = []
+    for href in extract_links(html, url):
+        href = normalize_link(url, href, _PATTERN)
+        if href:
+            links.append(href)
+
+    return digest(html), links
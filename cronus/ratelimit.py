@@ -0,0 +1,156 @@
+from email.utils import parsedate_to_datetime
+import urllib.parse
+import threading
+import asyncio
+import random
+import time
+
+
+def retry_after(headers):
+    """
+    Seconds asked for by a `Retry-After` header, `None` if
+    there's none or it can't be read
+    """
+    value = (headers or {}).get("Retry-After")
+    if not value:
+        return None
+
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+def backoff(retries, base=60, maximum=6 * 3600):
+    """
+    Exponential backoff with jitter, in seconds, before attempt
+    number `retries` + 1
+    """
+    delay = min(maximum, base * 2 ** max(0, retries - 1))
+    return delay * random.uniform(0.5, 1.0)
+
+
+class TokenBucket:
+
+    def __init__(self, rate, burst=1):
+        """
+        :param rate: tokens added per second, `None` for no limit
+                     (only :meth:`pause` holds tokens back)
+        :param burst: most tokens that can pile up
+        """
+        self.rate   = rate
+        self.burst  = burst
+        self.tokens = burst
+        self.last   = time.monotonic()
+        self.until  = 0.0 # end of a pause when there's no rate
+
+    def take(self):
+        """
+        Reserves a token
+
+        :return: seconds to wait before using it
+        """
+        now = time.monotonic()
+
+        if self.rate is None:
+            return max(0.0, self.until - now)
+
+        self.tokens = min(self.burst, self.tokens + (now - self.last) * self.rate)
+        self.last   = now
+        self.tokens -= 1
+
+        if self.tokens >= 0:
+            return 0.0
+
+        return -self.tokens / self.rate
+
+    def pause(self, seconds):
+        """
+        Hands out no token for the next `seconds`
+        """
+        if self.rate is None:
+            self.until = max(self.until, time.monotonic() + seconds)
+            return
+
+        self.take()
+        self.tokens = min(self.tokens, -seconds * self.rate)
+
+
+class HostLimiter:
+
+    def __init__(self, rate=5, burst=10):
+        """
+        A :class:`TokenBucket` per host
+
+        :param rate: requests per second per host, `None` for no
+                     limit besides the pauses after a 429/5xx
+        :param burst: requests a host can get back to back
+        """
+        self.rate    = rate
+        self.burst   = burst
+        self.buckets = {}
+        self.lock    = threading.Lock()
+
+    def bucket(self, url):
+        host = urllib.parse.urlparse(url).netloc
+
+        bucket = self.buckets.get(host)
+        if bucket is None:
+            bucket = self.buckets[host] = TokenBucket(self.rate, self.burst)
+
+        return bucket
+
+    def take(self, url):
+        with self.lock:
+            return self.bucket(url).take()
+
+    def pause(self, url, seconds):
+        with self.lock:
+            self.bucket(url).pause(seconds)
+
+
+class AdaptiveConcurrency:
+
+    def __init__(self, initial=10, minimum=1, maximum=100, target_latency=2.0):
+        """
+        Limits requests in flight, adjusting the limit as responses
+        come in: it grows by about one per round of responses under
+        `target_latency` and halves on an error or a slow response
+
+        :param initial: limit to start with
+        :param minimum: lowest limit
+        :param maximum: highest limit
+        :param target_latency: seconds a healthy response takes at most
+        """
+        self.limit    = float(initial)
+        self.minimum  = minimum
+        self.maximum  = maximum
+        self.target_latency = target_latency
+        self.in_flight = 0
+        self._cond     = None
+
+    @property
+    def cond(self):
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        return self._cond
+
+    async def acquire(self):
+        async with self.cond:
+            while self.in_flight >= int(self.limit):
+                await self.cond.wait()
+            self.in_flight += 1
+
+    async def release(self, latency=None, error=False):
+        if error or (latency is not None and latency > self.target_latency):
+            self.limit = max(self.minimum, self.limit / 2)
+        else:
+            self.limit = min(self.maximum, self.limit + 1 / self.limit)
+
+        async with self.cond:
+            self.in_flight -= 1
+            self.cond.notify_all()
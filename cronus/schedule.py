@@ -0,0 +1,42 @@
+import time
+
+
+class Scheduler:
+
+    def __init__(self, initial=86400, minimum=3600, maximum=30 * 86400,
+                    faster=0.5, slower=1.5):
+        """
+        Picks when a page should be visited again from how often
+        it has been changing: the revisit interval shrinks every time
+        a visit finds new content and grows every time it doesn't,
+        so it settles around the page's own rate of change
+
+        :param initial: seconds before the second visit
+        :param minimum: shortest interval allowed
+        :param maximum: longest interval allowed
+        :param faster: interval multiplier after a change
+        :param slower: interval multiplier after no change
+        """
+
+        self.initial = initial
+        self.minimum = minimum
+        self.maximum = maximum
+        self.faster  = faster
+        self.slower  = slower
+
+    def next(self, interval, changed, now=None):
+        """
+        :param interval: the page's current interval, `None` if it's new
+        :param changed: whether the last visit found new content
+
+        :return: (new interval, next visit timestamp)
+        """
+        now = time.time() if now is None else now
+
+        if not interval:
+            interval = self.initial
+        else:
+            interval = interval * (self.faster if changed else self.slower)
+            interval = min(self.maximum, max(self.minimum, interval))
+
+        return interval, now + interval
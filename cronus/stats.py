@@ -0,0 +1,154 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from contextlib import contextmanager
+from collections import defaultdict
+import threading
+import bisect
+import json
+import time
+import os
+
+
+class Histogram:
+
+    # upper bounds of the buckets, in seconds
+    BOUNDS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                0.5, 1, 2.5, 5, 10, 30, 60, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BOUNDS)
+        self.count  = 0
+        self.total  = 0.0
+        self.max    = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max    = max(self.max, value)
+
+    def quantile(self, q):
+        """
+        Upper bound of the bucket holding the `q` quantile
+        """
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(self.BOUNDS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+
+        return self.max
+
+    def snapshot(self):
+        return {
+            "count" : self.count,
+            "mean"  : self.total / self.count if self.count else 0.0,
+            "p50"   : self.quantile(0.5),
+            "p90"   : self.quantile(0.9),
+            "p99"   : self.quantile(0.99),
+            "max"   : self.max
+        }
+
+
+class Stats:
+
+    def __init__(self):
+        """
+        Counters, latency histograms and gauges of a crawler
+
+        Counters are totals since start (`bytes`, `status.200`,
+        `errors.TimeoutError` ...), histograms are timings in seconds
+        per stage (`fetch`, `parse`, `store`, `db`) and gauges are read
+        when a snapshot is taken (queue depths, concurrency limit)
+        """
+        self.started    = time.time()
+        self.counters   = defaultdict(int)
+        self.histograms = defaultdict(Histogram)
+        self.gauges     = {}
+        self.lock       = threading.Lock()
+        self._server    = None
+
+    def incr(self, name, n=1):
+        with self.lock:
+            self.counters[name] += n
+
+    def observe(self, name, value):
+        with self.lock:
+            self.histograms[name].observe(value)
+
+    def gauge(self, name, fn):
+        """
+        :param fn: returns the current value
+        """
+        self.gauges[name] = fn
+
+    @contextmanager
+    def timer(self, name):
+        start = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe(name, time.monotonic() - start)
+
+    def snapshot(self):
+        elapsed = max(time.time() - self.started, 1e-9)
+
+        with self.lock:
+            counters   = dict(self.counters)
+            histograms = { k : h.snapshot() for k, h in self.histograms.items() }
+
+        gauges = {}
+        for name, fn in list(self.gauges.items()):
+            try:
+                gauges[name] = fn()
+            except Exception:
+                gauges[name] = None
+
+        return {
+            "uptime"     : elapsed,
+            "pages_per_sec" : counters.get("pages", 0) / elapsed,
+            "bytes_per_sec" : counters.get("bytes", 0) / elapsed,
+            "counters"   : counters,
+            "latency"    : histograms,
+            "gauges"     : gauges
+        }
+
+    def dump(self, path):
+        """
+        Writes a snapshot to `path` as json
+        """
+        tmp = path + ".tmp"
+        with open(tmp, "w") as fp:
+            json.dump(self.snapshot(), fp, indent=2, sort_keys=True)
+
+        os.replace(tmp, path)
+
+    def serve(self, port, host="127.0.0.1"):
+        """
+        Serves snapshots as json on `http://host:port/` from
+        a background thread
+        """
+        stats = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                body = json.dumps(stats.snapshot(), indent=2, sort_keys=True).encode("UTF-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        self._server = ThreadingHTTPServer((host, port), Handler)
+        thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        thread.start()
+
+        return self._server
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server = None
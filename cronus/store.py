@@ -0,0 +1,327 @@
+from tldextract import extract
+from .dedupe import fingerprint
+import threading
+import sqlite3
+import struct
+import base64
+import zlib
+import glob
+import os
+
+
+class FileStore:
+
+    def __init__(self, directory):
+        """
+        One file per page: `<directory>/<domain>/<base64 url>`
+
+        Every page written is also appended to `manifest.log`, so
+        readers can pick up the pages written since a position in
+        it (see :meth:`changes`) instead of listing the folders
+
+        :param directory: root folder, i.e `<working_dir>/site`
+        """
+        self.directory = directory
+        self.manifest_path = os.path.join(directory, "manifest.log")
+        self.manifest  = None
+        self.lock      = threading.Lock()
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        if not os.path.exists(self.manifest_path):
+            self.build_manifest()
+
+    def build_manifest(self):
+        """
+        Lists the pages stored before there was a manifest,
+        oldest first. Done once, it stats every file
+        """
+        files = glob.glob(os.path.join(self.directory, "*", "*"))
+        files.sort(key=os.path.getmtime)
+
+        tmp = self.manifest_path + ".tmp"
+        with open(tmp, "w", encoding="UTF-8") as fp:
+            for filename in files:
+                fp.write(os.path.relpath(filename, self.directory) + "\n")
+
+        os.replace(tmp, self.manifest_path)
+
+    def _open_manifest(self):
+        manifest = open(self.manifest_path, "a", encoding="UTF-8")
+
+        # finish a line torn by a crash, readers skip the empty line
+        if manifest.tell() > 0:
+            with open(self.manifest_path, "rb") as fp:
+                fp.seek(-1, os.SEEK_END)
+                if fp.read(1) != b"\n":
+                    manifest.write("\n")
+
+        return manifest
+
+    def path(self, url):
+        eu = extract(url)
+        fn = base64.b64encode(url.encode("UTF-8")).decode("UTF-8")
+
+        return os.path.join(self.directory, eu.domain, fn)
+
+    def put(self, url, html):
+        filename = self.path(url)
+        fp = os.path.dirname(filename)
+
+        if not os.path.exists(fp):
+            os.makedirs(fp, exist_ok=True)
+
+        with open(filename, "w", encoding="UTF-8", errors="ignore") as fp:
+            fp.write(html)
+
+        with self.lock:
+            if self.manifest is None:
+                self.manifest = self._open_manifest()
+
+            self.manifest.write(os.path.relpath(filename, self.directory) + "\n")
+
+    def get(self, url):
+        filename = self.path(url)
+
+        if os.path.exists(filename):
+            with open(filename, "r", encoding="UTF-8", errors="ignore") as fp:
+                return fp.read()
+
+    def scan(self):
+        for filename in glob.glob(os.path.join(self.directory, "*", "*")):
+            url = base64.b64decode(os.path.basename(filename)).decode("UTF-8")
+
+            with open(filename, "r", encoding="UTF-8", errors="ignore") as fp:
+                yield url, fp.read()
+
+    def changes(self, position=0):
+        """
+        Streams the pages written from `position` on, in the order
+        they were written. A page written twice comes up twice
+
+        :param position: a position from a previous call, 0 for all
+        :return: generator of (url, html, position after this page)
+        """
+        with self.lock:
+            if self.manifest is not None:
+                self.manifest.flush()
+
+        with open(self.manifest_path, "rb") as manifest:
+            manifest.seek(position)
+
+            for line in manifest:
+                if not line.endswith(b"\n"):
+                    # still being written
+                    break
+
+                position += len(line)
+                name = line.decode("UTF-8").strip()
+                if not name:
+                    continue
+
+                filename = os.path.join(self.directory, name)
+
+                if not os.path.exists(filename):
+                    continue
+
+                # the base64 name itself can hold a `/`
+                url = base64.b64decode(name.split(os.sep, 1)[1]).decode("UTF-8")
+
+                with open(filename, "r", encoding="UTF-8", errors="ignore") as fp:
+                    yield url, fp.read(), position
+
+    def flush(self):
+        with self.lock:
+            if self.manifest is not None:
+                self.manifest.flush()
+                os.fsync(self.manifest.fileno())
+
+    def close(self):
+        self.flush()
+
+        with self.lock:
+            if self.manifest is not None:
+                self.manifest.close()
+                self.manifest = None
+
+
+# magic, url length, compressed html length, crc32 of the compressed html
+RECORD = struct.Struct("<4sIII")
+MAGIC  = b"NRS1"
+
+# a (segment, offset) position as one number, offset in the low bits
+POSITION_BITS = 40
+OFFSET_MASK   = (1 << POSITION_BITS) - 1
+
+class SegmentStore:
+
+    def __init__(self, directory, segment_size=256 * 1024 * 1024, level=6):
+        """
+        Append-only page store. Pages are zlib compressed and packed
+        one after the other into `<directory>/<n>.seg` files, a new
+        segment starting once the current one reaches `segment_size`.
+        `<directory>/index.db` maps the url fingerprint to the record's
+        (segment, offset) for random reads
+
+        :param directory: folder holding the segments
+        :param segment_size: bytes per segment before rolling over
+        :param level: zlib compression level
+        """
+        self.directory    = directory
+        self.segment_size = segment_size
+        self.level        = level
+        self.lock         = threading.Lock()
+        self._readers     = {}
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.index = sqlite3.connect(os.path.join(directory, "index.db"),
+                                     check_same_thread=False)
+        self.index.execute("PRAGMA journal_mode = WAL")
+        self.index.execute("""
+            CREATE TABLE IF NOT EXISTS page (
+                fp BLOB PRIMARY KEY,
+                segment INTEGER,
+                offset INTEGER
+            ) WITHOUT ROWID""")
+
+        self.segment = None
+        self.writer  = None
+
+    def segments(self):
+        names = glob.glob(os.path.join(self.directory, "*.seg"))
+        return sorted(int(os.path.basename(n)[:-4]) for n in names)
+
+    def segment_path(self, segment):
+        return os.path.join(self.directory, "%06d.seg" % segment)
+
+    def put(self, url, html):
+        u    = url.encode("UTF-8")
+        data = zlib.compress(html.encode("UTF-8", errors="ignore"), self.level)
+
+        with self.lock:
+            if self.writer is None or self.writer.tell() >= self.segment_size:
+                self._roll()
+
+            offset = self.writer.tell()
+            self.writer.write(RECORD.pack(MAGIC, len(u), len(data), zlib.crc32(data)))
+            self.writer.write(u)
+            self.writer.write(data)
+
+            self.index.execute("INSERT OR REPLACE INTO page VALUES (?, ?, ?)",
+                               (fingerprint(url), self.segment, offset))
+
+    def _roll(self):
+        # a writer always starts a fresh segment so a write torn
+        # by a crash can only ever be at the end of a segment
+        if self.writer is not None:
+            self.writer.close()
+
+        segments = self.segments()
+        self.segment = segments[-1] + 1 if segments else 0
+        self.writer  = open(self.segment_path(self.segment), "ab")
+
+    def _flush(self):
+        if self.writer is not None:
+            self.writer.flush()
+
+    def _reader(self, segment):
+        reader = self._readers.get(segment)
+        if reader is None:
+            reader = self._readers[segment] = open(self.segment_path(segment), "rb")
+
+        return reader
+
+    def _read(self, fp):
+        """
+        Reads the record at the current position of `fp`
+
+        :return: (url, html) or `None` at the end of the segment
+        """
+        header = fp.read(RECORD.size)
+        if len(header) < RECORD.size:
+            return None
+
+        magic, ulen, dlen, crc = RECORD.unpack(header)
+        url  = fp.read(ulen)
+        data = fp.read(dlen)
+
+        if magic != MAGIC or len(data) < dlen or zlib.crc32(data) != crc:
+            # torn write at the end of the segment
+            return None
+
+        return url.decode("UTF-8"), zlib.decompress(data).decode("UTF-8")
+
+    def get(self, url):
+        with self.lock:
+            row = self.index.execute("SELECT segment, offset FROM page WHERE fp = ?",
+                                     (fingerprint(url),)).fetchone()
+            if row is None:
+                return None
+
+            self._flush()
+            reader = self._reader(row[0])
+            reader.seek(row[1])
+            record = self._read(reader)
+
+        if record is not None:
+            return record[1]
+
+    def scan(self, segment=0, offset=0):
+        """
+        Streams every record from (`segment`, `offset`) on,
+        in the order they were written
+
+        :return: generator of (url, html, (segment, next offset))
+        """
+        with self.lock:
+            self._flush()
+
+        for s in self.segments():
+            if s < segment:
+                continue
+
+            with open(self.segment_path(s), "rb") as fp:
+                if s == segment:
+                    fp.seek(offset)
+
+                while True:
+                    record = self._read(fp)
+                    if record is None:
+                        break
+
+                    yield record + ((s, fp.tell()),)
+
+    def changes(self, position=0):
+        """
+        Same as :meth:`scan` with the (segment, offset) position
+        packed in one number, see :meth:`FileStore.changes`
+        """
+        segment, offset = position >> POSITION_BITS, position & OFFSET_MASK
+
+        for url, html, (s, o) in self.scan(segment, offset):
+            yield url, html, (s << POSITION_BITS) | o
+
+    def flush(self):
+        with self.lock:
+            if self.writer is not None:
+                self.writer.flush()
+                os.fsync(self.writer.fileno())
+
+            self.index.commit()
+
+    def close(self):
+        self.flush()
+
+        with self.lock:
+            if self.writer is not None:
+                self.writer.close()
+                self.writer = None
+
+            self.index.close()
+
+            for reader in self._readers.values():
+                reader.close()
+            self._readers = {}
@@ -1,5 +1,6 @@
 from cronus import Cronus
 import  re
+import sys
 config  = {
             "pass":[
                 re.compile("https://www.nairaland.com/[A-Za-z0-9-]+/[0-9]+"),
@@ -10,6 +11,10 @@ config  = {
             "seed":["https://www.nairaland.com/"],
             "working_dir":"nairaland",
             "limit_urls":200,
+            "bloom":True,
+            # no per host rate by default, the async engine adapts its
+            # concurrency to the site's latency and errors instead.
+            # "rate":5, caps every host at 5 requests/s (~300 pages/min)
 			"recent": [
 				"https://www.nairaland.com/",
 				"https://www.nairaland.com/politics",
@@ -27,4 +32,10 @@ config  = {
 }
 
 c = Cronus(**config)
-c.run()
+
+if "--daemon" in sys.argv:
+    c.run_forever()
+elif "--async" in sys.argv:
+    c.run_async()
+else:
+    c.run()
@@ -1,7 +1,11 @@
-for n in {1..100}
-do
-	echo -n ""
-	echo -n "---------------------------------[$n]-------------------------"
-	echo -n ""
-	python3 run.py
-done
+# Crawls continuously in one process (Ctrl-C / SIGTERM to stop),
+# the old restart loop is kept below for reference
+python3 run.py --daemon
+
+#for n in {1..100}
+#do
+#	echo -n ""
+#	echo -n "---------------------------------[$n]-------------------------"
+#	echo -n ""
+#	python3 run.py
+#done
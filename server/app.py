@@ -1,12 +1,15 @@
 from flask import Flask, render_template, request, jsonify
 import os
 from testi.index import Index
+from testi.cache import ResultCache
 import time
 from urllib.parse import urlparse
 from flask_sqlalchemy import SQLAlchemy
 
 
 INDEX = Index("myindex")
+# set RESULT_CACHE to a sqlite file to share cached pages between workers
+RESULTS = ResultCache(INDEX, path=os.environ.get("RESULT_CACHE"))
 
 import os
 
@@ -84,7 +87,7 @@ def search():
         q.save()
 
     t1 = time.time()
-    results = INDEX.search(query.lower().strip(), offset=page)
+    results = RESULTS.search(query.lower().strip(), offset=page)
     t2 = time.time()
     results.time = time_fmt(("%.17f" % (t2-t1)).rstrip('0').rstrip('.')) 
 
@@ -96,7 +99,7 @@ def suggest():
     suggestions = []
     
     if query:
-        results = INDEX.search('title:"{}"'.format(query))
+        results = RESULTS.search('title:"{}"'.format(query))
         suggestions = [x.get("highlight") for x in results]
         suggestions = [x for x in suggestions if x.strip()]
         
@@ -19,5 +19,5 @@ schema = Schema(url=ID(stored=True,unique=True),
         other_text=TEXT(analyzer=analyzer, field_boost=2))
 
 index = Index(schema, "nairaland_index", "nairaland")
-#data  = get_index_data("nairaland")
+#data  = get_index_data("nairaland", workers=None) # all cores
 #index.index_data(data)
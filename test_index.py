@@ -1,6 +1,7 @@
 from testi.index import Index
 import csv
-from utils import get_index_data
+from utils import stream_index_data
+from utils.extract import PARSER
 import sys
 
 index = Index("myindex")
@@ -10,16 +11,22 @@ def _add():
         reader = csv.DictReader(cf)
         index.add_doc(reader)
 
-def add(limit=3000):
-    data = get_index_data("nairaland", limit)
+def add(limit=3000, workers=None, parser=PARSER):
+    """
+    :param workers: extraction processes, all cores if `None`
+    """
+    data = stream_index_data("nairaland", limit, workers=workers, parser=parser)
     index.add_doc(data)
 
 if len(sys.argv) < 3:
     print("Usage: %s [FUNCTION] [PARAM]" % sys.argv[0])
+    print("       %s -a LIMIT [WORKERS] [PARSER]" % sys.argv[0])
     sys.exit(1)
 
 func = sys.argv[1].strip()
 if func == "-a":
-    add(limit=int(sys.argv[2]))
+    workers = int(sys.argv[3]) if len(sys.argv) > 3 else None
+    parser  = sys.argv[4] if len(sys.argv) > 4 else PARSER
+    add(limit=int(sys.argv[2]), workers=workers, parser=parser)
 elif func == "-s":
     index.search(sys.argv[2], pagesize=int(sys.argv[3]))
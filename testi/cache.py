@@ -0,0 +1,127 @@
+from collections import OrderedDict
+import threading
+import sqlite3
+import pickle
+import time
+import re
+
+SPACES = re.compile(r"\s+")
+
+
+class MemoryBackend:
+    def __init__(self, size=1024):
+        """
+        Least recently used entries go first once there are `size`
+        """
+        self.size    = size
+        self.entries = OrderedDict()
+        self.lock    = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+
+            return entry
+
+    def put(self, key, entry):
+        with self.lock:
+            self.entries[key] = entry
+            self.entries.move_to_end(key)
+
+            while len(self.entries) > self.size:
+                self.entries.popitem(last=False)
+
+class SQLiteBackend:
+    def __init__(self, path, size=10000):
+        """
+        Shared by every process opening `path`, i.e gunicorn
+        workers. The oldest entries go first once there are `size`
+        """
+        self.size = size
+        self.db   = sqlite3.connect(path, check_same_thread=False, timeout=10)
+        self.lock = threading.Lock()
+        self.puts = 0
+
+        self.db.execute("PRAGMA journal_mode = WAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS result (
+                key TEXT PRIMARY KEY,
+                entry BLOB,
+                created REAL
+            )""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS ix_result_created ON result (created)")
+        self.db.commit()
+
+    def get(self, key):
+        with self.lock:
+            row = self.db.execute("SELECT entry FROM result WHERE key = ?",
+                                  (key,)).fetchone()
+
+        if row is not None:
+            return pickle.loads(row[0])
+
+    def put(self, key, entry):
+        with self.lock:
+            self.db.execute("INSERT OR REPLACE INTO result VALUES (?, ?, ?)",
+                            (key, pickle.dumps(entry), time.time()))
+
+            self.puts += 1
+            if self.puts % 100 == 0:
+                self.db.execute("""
+                    DELETE FROM result WHERE key IN (
+                        SELECT key FROM result ORDER BY created DESC LIMIT -1 OFFSET ?
+                    )""", (self.size,))
+
+            self.db.commit()
+
+class ResultCache:
+    def __init__(self, index, size=1024, ttl=300, path=None):
+        """
+        Result pages of :meth:`testi.index.Index.search`, entries
+        are dropped after `ttl` seconds or once the index moves
+        to another revision
+
+        :param index: :class:`testi.index.Index`
+        :param size: most entries kept
+        :param ttl: seconds an entry is good for
+        :param path: sqlite file to share the cache between
+                     processes, kept in memory if `None`
+        """
+        self.index = index
+        self.ttl   = ttl
+
+        if path:
+            self.backend = SQLiteBackend(path, size)
+        else:
+            self.backend = MemoryBackend(size)
+
+    @staticmethod
+    def key(querystring, offset, pagesize):
+        query = SPACES.sub(" ", querystring.lower()).strip()
+        return "%s\x00%d\x00%d" % (query, offset, pagesize)
+
+    def search(self, querystring, offset=0, pagesize=15):
+        """
+        Same as :meth:`testi.index.Index.search`, the result is
+        a copy the caller is free to change
+        """
+        revision = self.index.revision()
+        if revision is None:
+            # the index is being replaced
+            return self.index.search(querystring, offset, pagesize)
+
+        key      = self.key(querystring, offset, pagesize)
+        revision = repr(revision)
+        entry    = self.backend.get(key)
+
+        if entry is not None:
+            created, rev, data = entry
+            if rev == revision and time.time() - created < self.ttl:
+                return pickle.loads(data)
+
+        result = self.index.search(querystring, offset, pagesize)
+        self.backend.put(key, (time.time(), revision, pickle.dumps(result)))
+
+        return result
@@ -4,9 +4,21 @@ import json
 import csv
 import time
 from xapian import BM25PlusWeight
+from multiprocessing import Process, Queue
+import threading
+import queue
+import shutil
+from html import escape
+import zlib
+import glob
+import os
 import re
 
 WORD = re.compile("\w+")
+
+# characters of `text` kept for snippets when indexing,
+# the best passages are picked from these only
+SNIPPET_SOURCE = 4096
 STOPWORDS = ['a', 'about', 'above', 'after', 'again', 'against', 
             'ain', 'all', 'am', 'an', 'and', 'any', 'are', 'aren', "aren't", 
             'as', 'at', 'be', 'because', 'been', 'before', 'being', 'below', 
@@ -49,6 +61,23 @@ class Result:
         self.correction = correction
         self.r1 = current_page * page_size
         self.r2 = self.r1 + len(results)	
+        self._matcher = None
+
+    @property
+    def matcher(self):
+        """
+        One pattern for all the words of the query, longest first
+        so a word isn't cut short by another one it starts with
+        """
+        if self._matcher is None:
+            terms = {t for t in self.query.lower().split() if WORD.fullmatch(t)}
+            terms = sorted(terms, key=len, reverse=True)
+
+            if terms:
+                self._matcher = re.compile(
+                    r"(?<!\w)(%s)" % "|".join(map(re.escape, terms)), re.IGNORECASE)
+
+        return self._matcher
 
     @property
     def _pages(self):
@@ -96,76 +125,365 @@ class Result:
             yield hit
 
     def highlight(self, text, big_text=False, words_per_fraction=20):
-        text = text.lower()
-        q = self.query.split()
-        fractions,fraction = [], ""
-        i = 0
-        highlights = []
+        """
+        Splits `text` (at most `SNIPPET_SOURCE` characters of it)
+        into passages of `words_per_fraction` words and marks the
+        query words in them, a single pass of :attr:`matcher` each
+
+        :return: list of (escaped html, matches), most matches first
+        """
+        words = text[:SNIPPET_SOURCE].split()
 
         if big_text:
-            for token in text.split():
-                fraction += token + " "
-                i += 1
-                if i >= words_per_fraction:
-                    fractions.append(fraction.strip() + "…")
-                    fraction = "…"
-                    i = 0
-            else:
-                fractions.append(fraction.strip())		
+            fractions = [" ".join(words[i:i + words_per_fraction])
+                            for i in range(0, len(words), words_per_fraction)]
+            last = len(fractions) - 1
+            fractions = [("…" if i else "") + f + ("…" if i < last else "")
+                            for i, f in enumerate(fractions)] or [""]
         else:
-            fractions = [text]
-
-        for fraction in fractions:
-            count = 0
-            for i in q:
-                i = i.strip()
-                if WORD.fullmatch(i):
-                    count += fraction.count(i)
-                    fraction = re.sub("(\s)({})".format(i)," <b>{}</b>".format(i), fraction)
-                    fraction = re.sub("^({})".format(i),"<b>{}</b>".format(i), fraction)
+            fractions = [" ".join(words)]
 
-                    #fraction = fraction.replace(i, "<b>" + i + "</b>")
-            highlights.append((fraction.strip(),count))
+        highlights = [self.mark(f) for f in fractions]
 
         return sorted(highlights, key=lambda x:x[1], reverse=True)
-		
+
+    def mark(self, text):
+        """
+        Wraps the query words of `text` in `<b>`, matching the raw
+        text and escaping what's around the matches, so a word can't
+        match inside an escaped entity (i.e `amp` in `&amp;`)
+
+        :return: (escaped html, matches)
+        """
+        if self.matcher is None:
+            return escape(text, quote=False), 0
+
+        # with a group, every odd item is a match
+        parts = self.matcher.split(text)
+        html  = "".join(
+            "<b>%s</b>" % escape(part, quote=False) if i % 2 else escape(part, quote=False)
+            for i, part in enumerate(parts))
+
+        return html, len(parts) // 2
+
+# value slots of the small fields shown with a hit
+SEC, TITLE, URL, DATE = 0, 1, 2, 3
+SLOTS = {"sec" : SEC, "title" : TITLE, "url" : URL, "date" : DATE}
+
+# document data: this byte then the zlib compressed `text`, older
+# documents hold all the extracted fields as json
+DATA_FORMAT = b"\x01"
+
+def pack_fields(doc, fields):
+    """
+    Stores what a results page shows of `fields` on `doc`, the
+    rest (`other_text`, `images` ...) is only indexed
+    """
+    for name, slot in SLOTS.items():
+        doc.add_value(slot, fields.get(name) or u"")
+
+    text = (fields.get("text") or u"")[:SNIPPET_SOURCE]
+    doc.set_data(DATA_FORMAT + zlib.compress(text.encode("UTF-8")))
+
+def unpack_fields(doc):
+    data = doc.get_data()
+
+    if data[:1] == b"{":
+        return json.loads(data.decode("UTF-8"))
+
+    fields = {name : doc.get_value(slot).decode("UTF-8") for name, slot in SLOTS.items()}
+    fields["text"] = zlib.decompress(data[1:]).decode("UTF-8")
+
+    return fields
+
+class Writer:
+    def __init__(self, dbpath, flush_every=10000, append=False, on_flush=None):
+        """
+        Bulk indexing writer, the database and term generator
+        are opened once and documents are committed in batches,
+        each batch in its own transaction
+
+        :param flush_every: documents per commit
+        :param append: documents are all new (i.e a rebuild into
+                       an empty database), they're added without
+                       looking up and replacing an older version
+        :param on_flush: called after every commit
+        """
+        self.db = xapian.WritableDatabase(dbpath, xapian.DB_CREATE_OR_OPEN)
+        self.termgenerator = xapian.TermGenerator()
+        self.termgenerator.set_stemmer(xapian.Stem("en"))
+
+        self.flush_every = flush_every
+        self.append      = append
+        self.on_flush    = on_flush
+        self.pending     = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.flush()
+        elif self.pending:
+            self.db.cancel_transaction()
+            self.pending = 0
+
+        self.close()
+
+    def document(self, fields):
+        text = fields.get("text",u'')
+        title = fields.get("title", u'')
+        identifier = fields.get("e_url", u'')
+        sec = fields.get("sec", u'')
+        more_text = fields.get("other_text", u"")
+
+        termgenerator = self.termgenerator
+        doc = xapian.Document()
+        termgenerator.set_document(doc)
+
+        termgenerator.index_text(title, 1, 'S')
+        termgenerator.index_text(text, 1, "XD")
+        termgenerator.index_text(more_text, 1, "X")
+        termgenerator.index_text(sec, 1, 'S')
+
+        termgenerator.index_text(title)
+        termgenerator.increase_termpos()
+        termgenerator.index_text(text)
+        termgenerator.increase_termpos()
+        termgenerator.index_text(more_text)
+        
+        pack_fields(doc, fields)
+            
+        idterm = u"Q" + identifier
+        doc.add_boolean_term(idterm)
+
+        return idterm, doc
+
+    def add(self, fields):
+        idterm, doc = self.document(fields)
+
+        if not self.pending:
+            self.db.begin_transaction()
+
+        if self.append:
+            self.db.add_document(doc)
+        else:
+            self.db.replace_document(idterm, doc)
+
+        self.pending += 1
+        if self.pending >= self.flush_every:
+            self.flush()
+
+    def flush(self):
+        if self.pending:
+            self.db.commit_transaction()
+            self.pending = 0
+
+        if self.on_flush:
+            self.on_flush()
+
+    def close(self):
+        self.db.close()
+
+def shard_of(identifier, shards):
+    return zlib.crc32(identifier.encode("UTF-8")) % shards
+
+def _index_shard(dbpath, batches, flush_every, append):
+    with Writer(dbpath, flush_every, append) as writer:
+        for batch in iter(batches.get, None):
+            for fields in batch:
+                writer.add(fields)
+
+def _send(batches, process, batch):
+    while True:
+        try:
+            return batches.put(batch, timeout=1)
+        except queue.Full:
+            if not process.is_alive():
+                raise RuntimeError("indexing process %s died" % process.name)
+
+def _replace_dir(new, path):
+    old = path + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+
+    if os.path.exists(path):
+        os.rename(path, old)
+    os.rename(new, path)
+
+    shutil.rmtree(old, ignore_errors=True)
+
 class Index:
     def __init__(self, dbpath):
         self.dbpath = dbpath
+        # a reader per thread, see `_reader`
+        self._local = threading.local()
+
+    def _version_files(self):
+        stub = os.path.join(self.dbpath, "XAPIANDB")
+        if not os.path.exists(stub):
+            return glob.glob(os.path.join(self.dbpath, "iam*"))
+
+        files = [stub]
+        with open(stub) as fp:
+            for line in fp:
+                shard = line.split()[-1]
+                files += glob.glob(os.path.join(self.dbpath, shard, "iam*"))
+
+        return files
+
+    def revision(self):
+        """
+        Changes whenever the database on disk does, taken from
+        the files Xapian rewrites on every commit so it costs a
+        few `stat` calls
+
+        :return: `None` while the index folder is being replaced,
+                 see :func:`_replace_dir`
+        """
+        try:
+            st = os.stat(self.dbpath)
+            out = [st.st_ino]
+
+            for fn in sorted(self._version_files()):
+                st = os.stat(fn)
+                out.append((fn, st.st_ino, st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            return None
+
+        return tuple(out)
+
+    def _reader(self):
+        """
+        This thread's database and query parser. The database is
+        reopened only when the revision has moved, and opened anew
+        when the index folder was replaced (see :meth:`build`)
+
+        :return: (database, query parser)
+        """
+        local    = self._local
+        revision = self.revision()
+
+        if revision is None:
+            if getattr(local, "db", None) is not None:
+                # the folder is being replaced, the open database
+                # serves until the new one is in place
+                return local.db, local.queryparser
+
+            # opened anew on the next call
+            revision = (None,)
+
+        if getattr(local, "db", None) is None or local.revision[0] != revision[0]:
+            local.db = xapian.Database(self.dbpath)
+
+            queryparser = xapian.QueryParser()
+            queryparser.set_stemmer(xapian.Stem("en"))
+            queryparser.set_stemming_strategy(queryparser.STEM_SOME)
+
+            queryparser.add_prefix("title", "S")
+            queryparser.add_prefix("text", "XD")
+
+            local.queryparser = queryparser
+        elif local.revision != revision:
+            local.db.reopen()
+
+        local.revision = revision
+
+        return local.db, local.queryparser
+
+    def add_doc(self, docs, flush_every=10000, append=False):
+        """
+        :param docs: iterable of extracted documents, if it has
+                     a `commit` method (i.e :class:`utils.extract.IndexData`)
+                     it's called after every commit so its position
+                     only moves once the documents are on disk
+        :param flush_every: documents per commit
+        :param append: skip replacing existing documents, only
+                       for documents that aren't in the index yet
+        """
+        on_flush = getattr(docs, "commit", None)
+
+        with Writer(self.dbpath, flush_every, append, on_flush) as writer:
+            for fields in docs:
+                writer.add(fields)
+
+    def build(self, docs, shards=None, merge=True, batch_size=500,
+                flush_every=10000, append=False):
+        """
+        Rebuilds the index from `docs` with a process per shard,
+        documents are split between them by a hash of `e_url`.
+        The old index is only replaced once every shard is done
+
+        :param shards: processes, all cores if `None`
+        :param merge: compact the shards into a single database,
+                      otherwise they're served as they are through a
+                      stub database. Xapian 1.4 can't write to a
+                      sharded database, :meth:`add_doc` then fails
+                      until the index is built again with `merge`
+        :param batch_size: documents sent to a process at a time
+        """
+        shards = shards or os.cpu_count() or 1
+        tmp    = self.dbpath + ".shards"
+        shutil.rmtree(tmp, ignore_errors=True)
+
+        names     = ["%02d" % i for i in range(shards)]
+        queues    = [Queue(maxsize=8) for _ in names]
+        processes = [Process(target=_index_shard, name="shard-" + name,
+                             args=(os.path.join(tmp, name), q, flush_every, append))
+                     for name, q in zip(names, queues)]
+
+        for process in processes:
+            process.start()
+
+        try:
+            pending = [[] for _ in names]
+            for fields in docs:
+                i = shard_of(fields.get("e_url", u""), shards)
+                pending[i].append(fields)
+
+                if len(pending[i]) >= batch_size:
+                    _send(queues[i], processes[i], pending[i])
+                    pending[i] = []
+
+            for i, batch in enumerate(pending):
+                if batch:
+                    _send(queues[i], processes[i], batch)
+                _send(queues[i], processes[i], None)
+        except BaseException:
+            for process in processes:
+                process.terminate()
+            raise
+        finally:
+            for process in processes:
+                process.join()
+
+        failed = [p.name for p in processes if p.exitcode != 0]
+        if failed:
+            raise RuntimeError("indexing failed in %s" % ", ".join(failed))
+
+        if merge:
+            db = xapian.Database()
+            for name in names:
+                db.add_database(xapian.Database(os.path.join(tmp, name)))
+
+            new = self.dbpath + ".new"
+            shutil.rmtree(new, ignore_errors=True)
+            db.compact(new)
+            db.close()
+
+            _replace_dir(new, self.dbpath)
+            shutil.rmtree(tmp)
+        else:
+            # opening a folder holding a XAPIANDB stub
+            # opens every database listed in it as one
+            with open(os.path.join(tmp, "XAPIANDB"), "w") as fp:
+                for name in names:
+                    fp.write("auto %s\n" % name)
 
-    def add_doc(self,docs):
-        db = xapian.WritableDatabase(self.dbpath, xapian.DB_CREATE_OR_OPEN)
-        termgenerator = xapian.TermGenerator()
-        termgenerator.set_stemmer(xapian.Stem("en"))
-        
-        for fields in docs: 
-            text = fields.get("text",u'')
-            title = fields.get("title", u'')
-            identifier = fields.get("e_url", u'')
-            sec = fields.get("sec", u'')
-            more_text = fields.get("other_text", u"")
-
-            doc = xapian.Document()
-            termgenerator.set_document(doc)
-
-            termgenerator.index_text(title, 1, 'S')
-            termgenerator.index_text(text, 1, "XD")
-            termgenerator.index_text(more_text, 1, "X")
-            termgenerator.index_text(sec, 1, 'S')
-
-            termgenerator.index_text(title)
-            termgenerator.increase_termpos()
-            termgenerator.index_text(text)
-            termgenerator.increase_termpos()
-            termgenerator.index_text(more_text)
-            
-            doc.add_value(0, sec)
+            _replace_dir(tmp, self.dbpath)
 
-            doc.set_data(json.dumps(fields))
-                
-            idterm = u"Q" + identifier
-            doc.add_boolean_term(idterm)
-            db.replace_document(idterm, doc)
+        commit = getattr(docs, "commit", None)
+        if commit:
+            commit()
     
     def _cquery(self, query, field, op):
 
@@ -187,14 +505,15 @@ class Index:
         return " AND ".join(queries)
 
     def search(self, querystring, offset=0, pagesize=15):
-        db = xapian.Database(self.dbpath)
-
-        queryparser = xapian.QueryParser()
-        queryparser.set_stemmer(xapian.Stem("en"))
-        queryparser.set_stemming_strategy(queryparser.STEM_SOME)
+        try:
+            return self._search(querystring, offset, pagesize)
+        except xapian.DatabaseModifiedError:
+            # a commit landed while reading, once more on the new revision
+            self._local.db.reopen()
+            return self._search(querystring, offset, pagesize)
 
-        queryparser.add_prefix("title", "S")
-        queryparser.add_prefix("text", "XD")
+    def _search(self, querystring, offset, pagesize):
+        db, queryparser = self._reader()
 
         _querystring = self.cquery(querystring)
         # print(_querystring)
@@ -216,7 +535,7 @@ class Index:
 
         for match in m_results:
             #print(dir(match), match.collapse_count)
-            fields = json.loads(match.document.get_data().decode("UTF-8"))
+            fields = unpack_fields(match.document)
             '''
             print("{rank}: #{docid} {title}".format(
                 rank=match.rank + 1,
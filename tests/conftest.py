@@ -0,0 +1,24 @@
+import pytest
+
+from cronus import Cronus
+
+
+@pytest.fixture
+def crawler(tmp_path):
+    """
+    Makes a :class:`Cronus` working in a temporary folder,
+    keyword arguments override the config
+    """
+    crawlers = []
+
+    def make(**config):
+        config = dict({"pass": [], "seed": [], "working_dir": str(tmp_path)}, **config)
+        c = Cronus(**config)
+        crawlers.append(c)
+        return c
+
+    yield make
+
+    for c in crawlers:
+        c.stats.close()
+        c.db.session.remove()
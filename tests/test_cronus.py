@@ -0,0 +1,58 @@
+from cronus.cronus import NEW, SKIPPED
+from cronus.links import compile_patterns
+
+
+def test_get_urls_skips_pass_rows_without_duplicates(crawler):
+    c = crawler(limit_urls=10)
+
+    # legacy rows, every other one matching a pattern added later
+    c.url.insertmany(*[
+        {"url": "https://www.example.com/%s/%d" % ("skip" if i % 2 else "page", i), "state": NEW}
+        for i in range(40)
+    ])
+    c.db.session.commit()
+    c._pass = compile_patterns([r"https://www\.example\.com/skip/\d+"])
+
+    urls = [row["url"] for row in c.get_urls()]
+
+    assert len(urls) == 10
+    assert len(set(urls)) == 10
+    assert all("/page/" in url for url in urls)
+
+    skipped = c.url.select().where(("state", "==", SKIPPED)).execute().fetchall()
+    assert len(skipped) == 10
+
+
+def test_recent_section_without_new_links_slows_down(crawler):
+    section = "https://www.example.com/news"
+    c = crawler()
+    # set after init, which would fetch the section
+    c.recent = [section]
+    c.seen.add("https://www.example.com/old-thread")
+
+    intervals = []
+    for poll in range(4):
+        # the hash changes every poll, the links don't
+        html = ('<a href="/old-thread">old</a> <a href="https://twitter.com/x">x</a> %d' % poll)
+        c.add_recent_links(section, 200, html, {})
+        c.checkpoint()
+        intervals.append(c.validators[section]["interval"])
+
+    assert intervals == sorted(intervals)
+    assert intervals[-1] > intervals[0]
+
+
+def test_recent_section_with_new_links_speeds_up(crawler):
+    section = "https://www.example.com/news"
+    c = crawler()
+    c.recent = [section]
+
+    intervals = []
+    for poll in range(3):
+        html = '<a href="/thread-%d">new</a>' % poll
+        c.add_recent_links(section, 200, html, {})
+        c.checkpoint()
+        intervals.append(c.validators[section]["interval"])
+
+    assert intervals == sorted(intervals, reverse=True)
+    assert intervals[-1] < intervals[0]
@@ -0,0 +1,37 @@
+from sqlalchemy import Integer, Text
+from sqlalchemy.sql.compiler import SQLCompiler
+
+from cronus.db import DB, param
+
+
+def test_prepared_statements_compile_once(tmp_path, monkeypatch):
+    db = DB("sqlite:///%s" % (tmp_path / "test.db"))
+    db.create_table("item", [
+        {"name": "id", "type": Integer, "primary_key": True},
+        {"name": "name", "type": Text},
+    ])
+    item = db.table("item")
+    item.insertmany(*[{"name": "n%d" % i} for i in range(10)])
+    item.select().where(("name", "==", param("name"))).prepare("by_name")
+
+    compiles = []
+    init = SQLCompiler.__init__
+
+    def counting_init(self, *args, **kwargs):
+        compiles.append(self)
+        init(self, *args, **kwargs)
+
+    monkeypatch.setattr(SQLCompiler, "__init__", counting_init)
+
+    for i in range(10):
+        rows = item.run("by_name", {"name": "n%d" % i}).fetchall()
+        assert [row["name"] for row in rows] == ["n%d" % i]
+
+    assert len(compiles) == 1
+
+    item.updatemany("name", ["n1", "n2"], name="x")
+    item.updatemany("name", ["n3", "n4", "n5"], name="y")
+    db.session.commit()
+
+    assert len(compiles) == 2
+    assert len(item.select().where(("name", "==", "y")).execute().fetchall()) == 3
@@ -0,0 +1,72 @@
+import os
+
+from cronus.dedupe import SeenURLs
+
+
+def test_seen_urls_persist_across_runs(tmp_path):
+    path = str(tmp_path / "seen.bloom")
+
+    seen = SeenURLs(path, capacity=1000)
+    assert not seen.loaded
+    assert seen.add("https://www.nairaland.com/a")
+    assert not seen.add("https://www.nairaland.com/a")
+    seen.save(force=True)
+
+    seen = SeenURLs(path, capacity=1000)
+    assert seen.loaded
+    assert "https://www.nairaland.com/a" in seen
+    assert "https://www.nairaland.com/b" not in seen
+    assert not seen.add("https://www.nairaland.com/a")
+    assert seen.add("https://www.nairaland.com/b")
+
+def test_saves_are_spaced_out(tmp_path):
+    path = str(tmp_path / "seen.bloom")
+
+    seen = SeenURLs(path, capacity=1000, save_every=3600)
+    seen.add("https://www.nairaland.com/a")
+    seen.save()
+    assert not os.path.exists(path)
+
+    seen.save(force=True)
+    assert "https://www.nairaland.com/a" in SeenURLs(path)
+
+    # nothing changed, nothing to save
+    os.utime(path, (0, 0))
+    seen.save(force=True)
+    assert os.path.getmtime(path) == 0
+
+    seen = SeenURLs(path, save_every=0)
+    seen.add("https://www.nairaland.com/b")
+    seen.save()
+    assert "https://www.nairaland.com/b" in SeenURLs(path)
+
+def test_warm(tmp_path):
+    seen = SeenURLs(str(tmp_path / "seen.bloom"), capacity=1000)
+    seen.warm("https://www.nairaland.com/%d" % i for i in range(100))
+
+    assert all("https://www.nairaland.com/%d" % i in seen for i in range(100))
+    assert not seen.add("https://www.nairaland.com/5")
+    assert seen.add("https://www.nairaland.com/100")
+
+    # without a bloom filter only what's added is seen
+    seen = SeenURLs()
+    seen.warm(["https://www.nairaland.com/a"])
+    assert "https://www.nairaland.com/a" not in seen
+
+def test_crawler_saves_the_filter_on_shutdown_and_warms_it(crawler, tmp_path):
+    path = str(tmp_path / "seen.bloom")
+    seed = ["https://www.nairaland.com/a", "https://www.nairaland.com/b"]
+
+    c = crawler(seed=seed, bloom=True)
+    c.seen.add("https://www.nairaland.com/found")
+    c.checkpoint()
+    assert not os.path.exists(path)
+
+    c.checkpoint(final=True)
+    assert "https://www.nairaland.com/found" in SeenURLs(path)
+
+    # a lost filter is rebuilt from the url table
+    os.remove(path)
+    c = crawler(seed=[], bloom=True)
+    assert not c.seen.loaded
+    assert all(url in c.seen for url in seed)
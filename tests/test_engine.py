@@ -0,0 +1,257 @@
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import Counter
+import threading
+import asyncio
+import json
+import time
+import os
+
+import pytest
+
+from cronus.cronus import Cronus, CRAWLED, RETRY, FAILED, NEW
+from cronus.engine import AsyncEngine
+
+
+class Site(BaseHTTPRequestHandler):
+    """
+    A small stand-in site:
+
+    `/`       links to every other page and off-site
+    `/a`      has an etag, answers `304` when it's sent back
+    `/b`      links back to `/a`
+    `/flaky`  always `503`
+    `/gone`   always `404`
+    `/recovers` `503` the first time, `200` afterwards
+    `/naira`  non-ascii text
+    """
+    requests = Counter()
+    conditional = Counter()
+
+    def do_GET(self):
+        Site.requests[self.path] += 1
+
+        if self.path == "/":
+            self.reply(200, '<a href="/a">a</a> <a href="/b">b</a> <a href="/flaky">f</a>'
+                            ' <a href="/gone">g</a> <a href="https://twitter.com/x">t</a>')
+        elif self.path == "/a":
+            if self.headers.get("If-None-Match") == '"v1"':
+                Site.conditional[self.path] += 1
+                self.reply(304)
+            else:
+                self.reply(200, "<h2>page a</h2>", {"ETag": '"v1"'})
+        elif self.path == "/b":
+            self.reply(200, '<h2>page b</h2> <a href="/a">a</a>')
+        elif self.path == "/flaky":
+            self.reply(503, "busy")
+        elif self.path == "/recovers":
+            if Site.requests[self.path] == 1:
+                self.reply(503, "busy")
+            else:
+                self.reply(200, "<h2>back</h2>")
+        elif self.path == "/naira":
+            self.reply(200, "<h2>₦500 — price</h2>")
+        else:
+            self.reply(404, "not found")
+
+    def reply(self, status, body="", headers=None):
+        body = body.encode("UTF-8")
+
+        self.send_response(status)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        if status != 304:
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+
+        if status != 304:
+            self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def site():
+    Site.requests.clear()
+    Site.conditional.clear()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Site)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+
+    yield "http://127.0.0.1:%d" % server.server_address[1]
+
+    server.shutdown()
+    server.server_close()
+
+
+def rows(c):
+    return {row["url"]: dict(row.items()) for row in c.url.select().execute()}
+
+
+def make_due(c, *urls):
+    c.url.updatemany("url", list(urls), next_visit=0)
+    c.db.session.commit()
+
+
+@pytest.mark.parametrize("run, parse_workers", [
+    ("run", 0), ("run_async", 0), ("run_async", 2)])
+def test_batches_store_pages_and_track_failures(crawler, site, run, parse_workers):
+    c = crawler(seed=[site + "/"], limit_urls=10, penalty=0, max_retries=3,
+                parse_workers=parse_workers)
+
+    pooled = []
+
+    def process(*page, parsed=None):
+        pooled.append(parsed is not None)
+        Cronus.process(c, *page, parsed=parsed)
+
+    c.process = process
+
+    getattr(c, run)()
+
+    table = rows(c)
+    assert table[site + "/"]["state"] == CRAWLED
+    assert {url for url, row in table.items() if row["state"] == NEW} == {
+        site + "/a", site + "/b", site + "/flaky", site + "/gone"}
+
+    getattr(c, run)()
+
+    table = rows(c)
+    assert table[site + "/a"]["state"] == CRAWLED
+    assert table[site + "/a"]["etag"] == '"v1"'
+    assert table[site + "/b"]["state"] == CRAWLED
+    assert table[site + "/gone"]["state"] == FAILED
+
+    flaky = table[site + "/flaky"]
+    assert flaky["state"] == RETRY
+    assert flaky["retries"] == 1
+    assert flaky["next_visit"] > time.time()
+
+    assert c.store.get(site + "/a") == "<h2>page a</h2>"
+    assert c.store.get(site + "/flaky") is None
+    assert not any("twitter" in url for url in table)
+
+    # a revisit of an unchanged page is conditional and isn't stored again
+    stored = len(list(c.store.changes()))
+    interval = table[site + "/a"]["interval"]
+    make_due(c, site + "/a", site + "/flaky")
+
+    getattr(c, run)()
+
+    table = rows(c)
+    assert Site.conditional["/a"] == 1
+    assert len(list(c.store.changes())) == stored
+    assert table[site + "/a"]["state"] == CRAWLED
+    assert table[site + "/a"]["interval"] > interval
+    assert table[site + "/flaky"]["state"] == RETRY
+    assert table[site + "/flaky"]["retries"] == 2
+
+    # nothing left to do: every page was fetched once, plus the revisits
+    assert Site.requests == Counter({"/": 1, "/a": 2, "/b": 1, "/flaky": 2, "/gone": 1})
+
+    # with parser processes the 2xx pages went through them
+    assert sum(pooled) == (3 if parse_workers else 0)
+
+
+def test_run_forever_checkpoints_every_batch(crawler, site, tmp_path):
+    c = crawler(seed=[site + "/"], limit_urls=10, penalty=0)
+
+    checkpoints = []
+
+    def checkpoint(final=False):
+        Cronus.checkpoint(c, final)
+        checkpoints.append(dict(rows(c)))
+        if len(checkpoints) == 2:
+            c.stop()
+
+    c.checkpoint = checkpoint
+    c.run_forever(pause=0.1)
+
+    first, second = checkpoints[:2]
+    assert first[site + "/"]["state"] == CRAWLED
+    assert first[site + "/a"]["state"] == NEW
+    assert second[site + "/a"]["state"] == CRAWLED
+    assert second[site + "/flaky"]["state"] == RETRY
+    assert second[site + "/gone"]["state"] == FAILED
+
+    # the batch state is reset after a checkpoint
+    assert c.crawled == [] and c.fetched == {} and c.retrying == {}
+
+    stats = json.load(open(os.path.join(str(tmp_path), "stats.json")))
+    assert stats["counters"]["pages"] == 5
+    assert stats["counters"]["status.503"] == 1
+
+    # a restarted crawler carries on from what was checkpointed
+    restarted = crawler(seed=[site + "/"], limit_urls=10)
+    assert [row["url"] for row in restarted.get_urls()] == []
+    assert rows(restarted)[site + "/b"]["state"] == CRAWLED
+
+
+@pytest.mark.parametrize("run", ["run", "run_async"])
+def test_url_recovers_after_a_503(crawler, site, run):
+    c = crawler(seed=[site + "/recovers"], limit_urls=10, penalty=0)
+
+    getattr(c, run)()
+    assert rows(c)[site + "/recovers"]["state"] == RETRY
+
+    make_due(c, site + "/recovers")
+    getattr(c, run)()
+
+    row = rows(c)[site + "/recovers"]
+    assert row["state"] == CRAWLED
+    assert row["retries"] == 0
+    assert c.store.get(site + "/recovers") == "<h2>back</h2>"
+
+
+def test_a_page_that_fails_processing_does_not_stall_the_crawl(crawler, site):
+    c = crawler(penalty=0)
+    urls = [site + "/b?%d" % i for i in range(8)]
+
+    def process(url, *args, **kwargs):
+        raise OSError("no space left on device")
+
+    c.process = process
+    engine = AsyncEngine(c, concurrency=4, queue_size=2)
+
+    async def crawl():
+        try:
+            await asyncio.wait_for(engine.crawl(urls), 10)
+        finally:
+            await engine.close()
+
+    asyncio.run(crawl())
+
+    assert set(c.retrying) == set(urls)
+    assert c.stats.counters["errors.process"] == len(urls)
+
+
+def test_a_failing_parser_stops_the_crawl(crawler, site):
+    c = crawler(penalty=0)
+    engine = AsyncEngine(c, concurrency=4, queue_size=2)
+
+    async def parser(pages):
+        raise RuntimeError("parser died")
+
+    engine._parser = parser
+
+    async def crawl():
+        try:
+            await asyncio.wait_for(engine.crawl([site + "/b?%d" % i for i in range(8)]), 10)
+        finally:
+            await engine.close()
+
+    with pytest.raises(RuntimeError):
+        asyncio.run(crawl())
+
+
+@pytest.mark.parametrize("run", ["run", "run_async"])
+def test_bytes_are_counted_before_decoding(crawler, site, run):
+    c = crawler(seed=[site + "/naira"], limit_urls=10)
+
+    getattr(c, run)()
+
+    html = "<h2>₦500 — price</h2>"
+    assert c.store.get(site + "/naira") == html
+    assert c.stats.counters["bytes"] == len(html.encode("UTF-8"))
@@ -0,0 +1,130 @@
+import pytest
+import subprocess
+import sys
+import base64
+
+
+def test_extraction_does_not_load_the_crawler():
+    code = (
+        "import sys, logging, utils.extract\n"
+        "loaded = {'cronus.cronus', 'cronus.engine', 'sqlalchemy', 'aiohttp'} & set(sys.modules)\n"
+        "assert not loaded, loaded\n"
+        "assert not logging.getLogger().handlers\n"
+    )
+    subprocess.run([sys.executable, "-c", code], check=True)
+
+
+PAGE = """<html><head><title>Ignored</title></head><body>
+<h2>Topic %d - Politics - Nairaland</h2>
+<div class="narrow">Main text %d <img src="http://img.example.com/%d.png"></div>
+<div class="narrow">Reply %d</div>
+</body></html>"""
+
+
+def store_pages(tmp_path, n):
+    from cronus.store import FileStore
+
+    store = FileStore(str(tmp_path / "site"))
+    for i in range(n):
+        store.put("https://www.nairaland.com/%d/topic" % i, PAGE % (i, i, i, i))
+    store.close()
+
+
+@pytest.mark.parametrize("parser", ["html.parser", "lxml"])
+def test_pool_extraction_matches_in_process(tmp_path, parser):
+    from utils.extract import IndexData
+
+    store_pages(tmp_path, 12)
+
+    def extract(workers, config):
+        data = IndexData(str(tmp_path), limit=100, config=str(tmp_path / config),
+                         workers=workers, cache=False, parser=parser)
+        return list(data), data
+
+    docs, _ = extract(0, "serial.cursor")
+    pooled, data = extract(2, "pooled.cursor")
+
+    assert pooled == docs
+    assert [d["title"] for d in docs] == ["topic %d" % i for i in range(12)]
+    assert docs[0]["sec"] == "politics"
+    assert docs[0]["images"] == ["http://img.example.com/0.png"]
+    assert docs[0]["other_text"] == "Reply 0"
+
+    # the cursor moves on to the end of the write log
+    data.commit()
+    assert list(IndexData(str(tmp_path), config=str(tmp_path / "pooled.cursor"),
+                          cache=False, parser=parser)) == []
+
+
+@pytest.fixture
+def parsed(monkeypatch):
+    """
+    Urls handed to `extract_data`, in the order they were parsed
+    """
+    import utils.extract
+
+    urls = []
+    extract_data = utils.extract.extract_data
+
+    def counting(e_url, text, parser):
+        urls.append(base64.b64decode(e_url).decode("UTF-8"))
+        return extract_data(e_url, text, parser)
+
+    monkeypatch.setattr(utils.extract, "extract_data", counting)
+    return urls
+
+
+def test_cache_skips_unchanged_pages(tmp_path, parsed, monkeypatch):
+    import utils.extract
+    from utils.extract import IndexData
+    from cronus.store import FileStore
+
+    store_pages(tmp_path, 4)
+
+    def extract(config):
+        data = IndexData(str(tmp_path), limit=100, config=str(tmp_path / config))
+        docs = list(data)
+        data.commit()
+        return docs
+
+    docs = extract("first.cursor")
+    assert len(parsed) == 4
+
+    # a hit hands back the same document without parsing the page
+    del parsed[:]
+    assert extract("second.cursor") == docs
+    assert parsed == []
+
+    # a page whose html changed is parsed again
+    store = FileStore(str(tmp_path / "site"))
+    store.put("https://www.nairaland.com/1/topic", PAGE % (10, 10, 10, 10))
+    store.close()
+
+    changed = extract("first.cursor")
+    assert parsed == ["https://www.nairaland.com/1/topic"]
+    assert [d["title"] for d in changed] == ["topic 10"]
+
+    # and every page once the extraction changes
+    del parsed[:]
+    monkeypatch.setattr(utils.extract, "EXTRACT_VERSION", utils.extract.EXTRACT_VERSION + 1)
+    assert len(extract("third.cursor")) == 5
+    assert len(parsed) == 5
+
+def test_cache_scan(tmp_path):
+    from utils.cache import ExtractCache
+
+    cache = ExtractCache(str(tmp_path / "extracted"))
+    cache.put("a", cache.key("<h2>a</h2>"), {"title" : "a"})
+    cache.put("b", cache.key("<p>no title</p>"), None)
+    cache.put("c", cache.key("<h2>c</h2>"), {"title" : "c"})
+    cache.put("a", cache.key("<h2>a2</h2>"), {"title" : "a2"})
+
+    # the latest document of every url, empty ones left out
+    assert list(cache.scan()) == [{"title" : "c"}, {"title" : "a2"}]
+    assert cache.get("a", cache.key("<h2>a</h2>")) == (False, None)
+    assert cache.get("b", cache.key("<p>no title</p>")) == (True, None)
+    cache.close()
+
+    # documents of another version aren't scanned
+    assert list(ExtractCache(str(tmp_path / "extracted"), version=2).scan()) == []
+    assert len(list(ExtractCache(str(tmp_path / "extracted")).scan())) == 2
@@ -0,0 +1,32 @@
+import pytest
+
+xapian = pytest.importorskip("xapian")
+
+from testi.index import Result
+
+
+def result(query):
+    return Result(query, [], 0, 0, 15, 0)
+
+
+def test_highlight_marks_words_and_escapes_the_rest():
+    html, count = result("news").highlight("News & <more> news")[0]
+
+    assert html == "<b>News</b> &amp; &lt;more&gt; <b>news</b>"
+    assert count == 2
+
+
+@pytest.mark.parametrize("word", ["amp", "lt", "gt"])
+def test_highlight_never_matches_inside_entities(word):
+    html, count = result(word).highlight("a & b < c > d")[0]
+
+    assert html == "a &amp; b &lt; c &gt; d"
+    assert count == 0
+
+
+def test_highlight_picks_the_best_passage():
+    text = " ".join("w%d" % i for i in range(40)) + " news"
+    passages = result("news").highlight(text, big_text=True)
+
+    assert passages[0][1] == 1
+    assert "<b>news</b>" in passages[0][0]
@@ -0,0 +1,59 @@
+import pickle
+import re
+
+import pytest
+
+from cronus.links import extract_links, compile_patterns, can_add
+
+
+def test_quoting():
+    html = """<a href="/one">1</a> <A HREF='/two'>2</A> <a href=/three>3</a>
+              <a class="x" href = "/four?a=1&amp;b=2">4</a> <a name="top">top</a>"""
+
+    assert extract_links(html) == ["/one", "/two", "/three", "/four?a=1&b=2"]
+
+def test_only_the_href_attribute():
+    html = """<a data-href="/wrong" href="/right">x</a>
+              <a xhref="/wrong">x</a> <a\thref="/tab">x</a>"""
+
+    assert extract_links(html) == ["/right", "/tab"]
+
+def test_comments_scripts_and_styles_are_skipped():
+    html = """<a href="/kept">k</a>
+              <!-- <a href="/commented">c</a> -->
+              <script>document.write('<a href="/scripted">s</a>')</script>
+              <SCRIPT type="text/javascript">var a = '<a href="/upper">';</SCRIPT>
+              <style>a[href="/x"] { color: red }</style>
+              <a href="/after">a</a>
+              <!-- <a href="/unclosed">u</a>"""
+
+    assert extract_links(html) == ["/kept", "/after"]
+
+def test_resolved_against_the_page_or_its_base():
+    html = '<a href="b">b</a> <a href="/c">c</a> <a href="https://other.com/d">d</a>'
+    assert extract_links(html, "https://www.nairaland.com/a/") == [
+        "https://www.nairaland.com/a/b", "https://www.nairaland.com/c",
+        "https://other.com/d"]
+
+    html = '<!-- <base href="/wrong/"> --> <base target="_top" href="/base/"> ' + html
+    assert extract_links(html, "https://www.nairaland.com/a/")[0] == (
+        "https://www.nairaland.com/base/b")
+
+
+@pytest.mark.parametrize("patterns, url, added", [
+    ([re.compile("https://WWW.nairaland.com/x", re.I)], "https://www.nairaland.com/x", False),
+    ([re.compile("https://WWW.nairaland.com/x")], "https://www.nairaland.com/x", True),
+    (["(?i)https://WWW.nairaland.com/x", ".*/y"], "https://www.nairaland.com/x", False),
+    ([r".*/(\w+)/\1", ".*/y"], "https://www.nairaland.com/a/a", False),
+    ([r".*/(\w+)/\1", ".*/y"], "https://www.nairaland.com/a/b", True),
+    ([r".*/(?P<p>\w+)/z", r".*/(?P<p>\w+)/y"], "https://www.nairaland.com/a/y", False),
+    ([re.compile(".*/x # pattern with a comment", re.X), ".*/y"], "https://nairaland.com/x", False),
+    ([".*/x", ".*/y"], "https://www.nairaland.com/y", False),
+    ([".*/x", ".*/y"], "https://www.nairaland.com/z", True),
+    ([], "https://www.nairaland.com/z", True),
+])
+def test_pass_patterns(patterns, url, added):
+    pattern = compile_patterns(patterns)
+
+    assert can_add(url, pattern) is added
+    assert can_add(url, pickle.loads(pickle.dumps(pattern))) is added
@@ -0,0 +1,26 @@
+from cronus.ratelimit import HostLimiter, TokenBucket
+
+
+def test_unlimited_bucket_only_waits_out_pauses():
+    bucket = TokenBucket(None)
+
+    assert all(bucket.take() == 0.0 for _ in range(1000))
+
+    bucket.pause(30)
+    assert 29 < bucket.take() <= 30
+
+
+def test_rated_bucket_spaces_out_requests():
+    bucket = TokenBucket(5, burst=2)
+
+    assert bucket.take() == 0.0
+    assert bucket.take() == 0.0
+    assert 0.15 < bucket.take() <= 0.2
+
+
+def test_host_limiter_pauses_one_host():
+    limiter = HostLimiter(None)
+    limiter.pause("https://a.example.com/x", 10)
+
+    assert limiter.take("https://a.example.com/y") > 9
+    assert limiter.take("https://b.example.com/y") == 0.0
@@ -0,0 +1,38 @@
+import os
+
+import pytest
+
+xapian = pytest.importorskip("xapian")
+
+from testi.index import Index
+from testi.cache import ResultCache
+
+
+def docs(n, word="news"):
+    return [{"e_url" : "%s%d" % (word, i), "title" : "topic %d" % i, "text" : "%s %d" % (word, i),
+             "sec" : "politics", "other_text" : "", "images" : [], "url" : "/%d" % i}
+            for i in range(n)]
+
+
+def test_search_while_the_index_folder_is_replaced(tmp_path):
+    index = Index(str(tmp_path / "index"))
+    index.add_doc(docs(5))
+    cache = ResultCache(index)
+
+    assert index.search("news").count == 5
+    revision = index.revision()
+
+    # between the two renames of `_replace_dir`
+    os.rename(index.dbpath, index.dbpath + ".old")
+    try:
+        assert index.revision() is None
+        assert index.search("news").count == 5
+        assert cache.search("news").count == 5
+    finally:
+        os.rename(index.dbpath + ".old", index.dbpath)
+
+    assert index.revision() == revision
+
+    index.add_doc(docs(3, "sports"), append=True)
+    assert index.revision() != revision
+    assert index.search("sports").count == 3
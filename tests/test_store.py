@@ -0,0 +1,109 @@
+import os
+
+from cronus.store import SegmentStore, POSITION_BITS
+
+
+def page(i):
+    return "<h2>page %d</h2>" % i + "<p>some text</p>" * i
+
+def fill(store, n):
+    for i in range(n):
+        store.put("https://www.nairaland.com/%d" % i, page(i))
+
+
+def test_rolls_over_to_new_segments(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_size=200)
+    fill(store, 10)
+
+    # a segment is only written to until it reaches the size
+    segments = store.segments()
+    assert len(segments) > 1
+    assert all(os.path.getsize(store.segment_path(s)) < 200 + len(page(9)) + 100
+               for s in segments)
+    assert [url for url, html, _ in store.scan()] == [
+        "https://www.nairaland.com/%d" % i for i in range(10)]
+    assert store.get("https://www.nairaland.com/7") == page(7)
+
+    store.close()
+
+def test_get_after_reopen(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_size=200)
+    fill(store, 5)
+    store.close()
+
+    store = SegmentStore(str(tmp_path), segment_size=200)
+    assert store.get("https://www.nairaland.com/3") == page(3)
+    assert store.get("https://www.nairaland.com/9") is None
+
+    # a reopened store writes to a new segment and still
+    # reads the old ones
+    segments = store.segments()
+    store.put("https://www.nairaland.com/3", "changed")
+    assert store.segments()[-1] == segments[-1] + 1
+    assert store.get("https://www.nairaland.com/3") == "changed"
+    assert store.get("https://www.nairaland.com/4") == page(4)
+
+    store.close()
+
+def test_torn_write_is_dropped(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    fill(store, 3)
+    store.close()
+
+    path = store.segment_path(0)
+    with open(path, "r+b") as fp:
+        fp.truncate(os.path.getsize(path) - 3)
+
+    store = SegmentStore(str(tmp_path))
+    assert [url for url, html, _ in store.scan()] == [
+        "https://www.nairaland.com/0", "https://www.nairaland.com/1"]
+    assert store.get("https://www.nairaland.com/1") == page(1)
+    assert store.get("https://www.nairaland.com/2") is None
+
+    # new writes go after the torn one
+    store.put("https://www.nairaland.com/3", page(3))
+    assert [url for url, html, _ in store.scan()] == [
+        "https://www.nairaland.com/0", "https://www.nairaland.com/1",
+        "https://www.nairaland.com/3"]
+
+    store.close()
+
+def test_corrupt_record_fails_its_crc(tmp_path):
+    store = SegmentStore(str(tmp_path))
+    fill(store, 3)
+    store.close()
+
+    path = store.segment_path(0)
+    with open(path, "r+b") as fp:
+        fp.seek(-2, os.SEEK_END)
+        last = fp.read(1)
+        fp.seek(-2, os.SEEK_END)
+        fp.write(bytes([last[0] ^ 0xff]))
+
+    store = SegmentStore(str(tmp_path))
+    assert len(list(store.scan())) == 2
+    assert store.get("https://www.nairaland.com/2") is None
+
+    store.close()
+
+def test_changes_resume_from_a_packed_position(tmp_path):
+    store = SegmentStore(str(tmp_path), segment_size=200)
+    fill(store, 10)
+
+    changes   = list(store.changes())
+    positions = [position for _, _, position in changes]
+
+    assert positions == sorted(positions)
+    assert len({position >> POSITION_BITS for position in positions}) > 1
+
+    for i, position in enumerate(positions):
+        assert [url for url, _, _ in store.changes(position)] == [
+            url for url, _, _ in changes[i + 1:]]
+
+    # nothing new past the last position until a page is written
+    assert list(store.changes(positions[-1])) == []
+    store.put("https://www.nairaland.com/new", "new")
+    assert [url for url, _, _ in store.changes(positions[-1])] == [
+        "https://www.nairaland.com/new"]
+
+    store.close()
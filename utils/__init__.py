@@ -1,2 +1,2 @@
 from .index import Index
-from .extract import get_index_data
\ No newline at end of file
+from .extract import get_index_data, stream_index_data
\ No newline at end of file
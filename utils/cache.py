@@ -0,0 +1,112 @@
+import threading
+import hashlib
+import sqlite3
+import json
+import os
+
+
+class ExtractCache:
+
+    def __init__(self, directory, version=1):
+        """
+        Extracted documents keyed by url and a hash of the html
+        they came from, so a page is only parsed again once its
+        html changes
+
+        Documents are appended to `<directory>/docs.jsonl`,
+        `<directory>/index.db` maps the url to the offset of its
+        latest line
+
+        :param directory: folder holding the cache
+        :param version: version of the extraction, documents
+                        extracted by another version are misses
+        """
+        self.directory = directory
+        self.version   = version
+        self.lock      = threading.Lock()
+
+        if not os.path.exists(directory):
+            os.makedirs(directory)
+
+        self.path   = os.path.join(directory, "docs.jsonl")
+        self.writer = open(self.path, "ab")
+        self.reader = open(self.path, "rb")
+
+        self.index = sqlite3.connect(os.path.join(directory, "index.db"),
+                                     check_same_thread=False)
+        self.index.execute("PRAGMA journal_mode = WAL")
+        self.index.execute("""
+            CREATE TABLE IF NOT EXISTS doc (
+                url TEXT PRIMARY KEY,
+                hash TEXT,
+                version INTEGER,
+                offset INTEGER
+            ) WITHOUT ROWID""")
+
+    @staticmethod
+    def key(html):
+        return hashlib.sha1(html.encode("UTF-8", errors="ignore")).hexdigest()
+
+    def _read(self, offset):
+        self.reader.seek(offset)
+        return json.loads(self.reader.readline())
+
+    def get(self, url, key):
+        """
+        :param key: :meth:`key` of the page's html
+        :return: (found, document), the document is `None` when
+                 the page had nothing to extract
+        """
+        with self.lock:
+            row = self.index.execute(
+                "SELECT offset FROM doc WHERE url = ? AND hash = ? AND version = ?",
+                (url, key, self.version)).fetchone()
+
+            if row is None:
+                return False, None
+
+            self.writer.flush()
+            return True, self._read(row[0])["data"]
+
+    def put(self, url, key, data):
+        line = json.dumps({"url" : url, "hash" : key, "data" : data}) + "\n"
+
+        with self.lock:
+            offset = self.writer.tell()
+            self.writer.write(line.encode("UTF-8"))
+
+            self.index.execute("INSERT OR REPLACE INTO doc VALUES (?, ?, ?, ?)",
+                               (url, key, self.version, offset))
+
+    def scan(self):
+        """
+        Streams the latest document of every url without
+        touching the html, in the order they were cached
+        """
+        with self.lock:
+            self.writer.flush()
+            offsets = self.index.execute(
+                "SELECT offset FROM doc WHERE version = ? ORDER BY offset",
+                (self.version,)).fetchall()
+
+        with open(self.path, "rb") as fp:
+            for offset, in offsets:
+                fp.seek(offset)
+                data = json.loads(fp.readline())["data"]
+
+                if data:
+                    yield data
+
+    def flush(self):
+        with self.lock:
+            self.writer.flush()
+            os.fsync(self.writer.fileno())
+            self.index.commit()
+
+    def close(self):
+        self.flush()
+
+        with self.lock:
+            self.writer.close()
+            self.reader.close()
+            self.index.close()
@@ -1,32 +1,70 @@
 from bs4 import BeautifulSoup
-import glob
 import os
 import base64
 from pprint import pprint
 import re
 import json
 from htmldate import find_date
+from itertools import islice
+from functools import partial
+from multiprocessing import Pool
+from cronus.store import FileStore, SegmentStore
+from .cache import ExtractCache
 
 EC = re.compile("[a-z]+(/[a-z]+)?")
 
-def get_site_files(dir, p="*"):
-    if os.path.exists(dir):
-        return sorted(glob.glob(os.path.join(dir, "*")), key=os.path.getmtime, reverse=True)
+# bump when `extract_data` changes what it returns,
+# cached documents of older versions are extracted again
+EXTRACT_VERSION = 1
 
-def get_config(fn, n=0):
-    if n > 0:
-        with open(fn, "w") as fp:
-            fp.write(str(n))
-        
-    else:
-        try:        
-            with open(fn, "r") as fp:
-                j = fp.read()
-                n = int(j.strip())
-        except Exception as err:
-            print(err)
-    
-    return n
+# BeautifulSoup tree builder, lxml is several times faster
+# than the pure python "html.parser"
+try:
+    import lxml
+    PARSER = "lxml"
+except ImportError:
+    PARSER = "html.parser"
+
+def get_store(name):
+    segments = os.path.join(name, "segments")
+
+    if os.path.exists(segments):
+        return SegmentStore(segments)
+
+    return FileStore(os.path.join(name, "site"))
+
+def get_site_pages(name, position=0):
+    """
+    Yields (e_url, html, position) for every page the crawler
+    stored for `name` after `position`, reading the store's log
+    of writes so only the new pages are touched
+
+    :param position: position yielded with the last page handled,
+                     0 to start from the first page
+    """
+    for url, text, position in get_store(name).changes(position):
+        e_url = base64.b64encode(url.encode("UTF-8")).decode("UTF-8")
+        yield e_url, text, position
+
+def get_cursor(fn):
+    try:
+        with open(fn, "r") as fp:
+            return int(fp.read().strip())
+    except FileNotFoundError:
+        return 0
+
+def set_cursor(fn, position):
+    """
+    Saves `position` so it survives a crash: written to a temp
+    file, synced and moved over the old one
+    """
+    tmp = fn + ".tmp"
+    with open(tmp, "w") as fp:
+        fp.write(str(position))
+        fp.flush()
+        os.fsync(fp.fileno())
+
+    os.replace(tmp, fn)
 
 def get_sec(text):
     text = text.lower()
@@ -43,26 +81,37 @@ def get_sec(text):
         
     return sec
 
-def extract_data(e_url, text):
+def extract_data(e_url, text, parser=PARSER):
+    """
+    :param parser: BeautifulSoup tree builder, see `PARSER`
+    """
 	
     date = "" # find_date(text)    
-    soup = BeautifulSoup(text)
-    title = soup.select_one("h2")
-    images = soup.select('div.narrow img')
-    
-    images = [i.attrs.get("src") for i in images]
+    soup = BeautifulSoup(text, parser)
+
+    # one walk over the tree for everything that's needed
+    h2, title, content, tables = None, None, [], []
+    for tag in soup.find_all(("h2", "title", "div", "table")):
+        if tag.name == "div":
+            if "narrow" in tag.get("class", ()):
+                content.append(tag)
+        elif tag.name == "table":
+            tables.append(tag)
+        elif tag.name == "h2":
+            h2 = h2 or tag
+        else:
+            title = title or tag
+
+    images = [i.attrs.get("src") or "" for c in content for i in c.find_all("img")]
     images = [i for i in images if i.startswith("http")]
     
-    if not title:
-        title = soup.select_one("title")
+    title = h2 or title
     
     if not title:
         return
     
     title = title.text.strip()
     
-    content = soup.select("div.narrow")
-    
     main_text  = ""
     other_text = []
     
@@ -80,7 +129,6 @@ def extract_data(e_url, text):
     title, sec = get_sec(title)
     
     if sec == "profile":
-        tables = soup.select("table")
         if len(tables) >= 3:    
             main_text = tables[2].text
             
@@ -98,29 +146,160 @@ def extract_data(e_url, text):
     # print(title, sec)
     
     return data
-    
-def get_index_data(name, limit=10):
-    d = "%(name)s/site/%(name)s" % {"name":name}
-    files = get_site_files(d)
 
-    data = []
-    n = get_config("index.config")
-    k = 0
+def _extract_page(page, parser=PARSER):
+    e_url, text, position = page
+    return extract_data(e_url, text, parser), position
+
+def extract_pages(pages, workers=None, chunksize=64, ordered=True, cache=None,
+                    parser=PARSER):
+    """
+    Runs :func:`extract_data` over `pages` in a pool of processes
+
+    :param pages: iterable of (e_url, html, position)
+    :param workers: processes, all cores if `None`, 0 to
+                    extract in this process
+    :param chunksize: pages sent to a process at a time
+    :param ordered: yield in the order of `pages`, needed when the
+                    position is saved. Unordered is a bit faster
+                    when the whole corpus is extracted
+    :param cache: :class:`utils.cache.ExtractCache`, only pages
+                  whose html isn't in it are extracted
+    :param parser: BeautifulSoup tree builder, see `PARSER`
+
+    :return: generator of (e_data or `None`, position)
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    pages = iter(pages)
+    pool  = Pool(workers) if workers else None
+    extract = partial(_extract_page, parser=parser)
+
+    try:
+        # the pool reads its input as fast as it can, it's handed a
+        # few chunks per process at a time so the corpus isn't all
+        # pulled into memory
+        while True:
+            batch = list(islice(pages, chunksize * max(workers, 1) * 4))
+            if not batch:
+                break
+
+            results = [None] * len(batch)
+            misses  = {}
+
+            for i, (e_url, text, position) in enumerate(batch):
+                key = None
+                if cache is not None:
+                    key = cache.key(text)
+                    found, e_data = cache.get(e_url, key)
+                    if found:
+                        results[i] = e_data, position
+                        continue
+
+                misses[position] = i, key
+
+            if not ordered:
+                yield from (r for r in results if r is not None)
+
+            todo = [batch[i] for i, _ in misses.values()]
+            if pool is None:
+                extracted = map(extract, todo)
+            elif ordered:
+                extracted = pool.imap(extract, todo, chunksize)
+            else:
+                extracted = pool.imap_unordered(extract, todo, chunksize)
+
+            for e_data, position in extracted:
+                i, key = misses[position]
+                results[i] = e_data, position
+
+                if cache is not None:
+                    cache.put(batch[i][0], key, e_data)
+
+                if not ordered:
+                    yield e_data, position
+
+            if ordered:
+                yield from results
+    finally:
+        if pool is not None:
+            pool.terminate()
     
-    for i, f in enumerate(files[n:]):
-        with open(f, "r") as fp:
-            text = fp.read()
-            
-            e_data = extract_data(os.path.basename(f), text)
+class IndexData:
+
+    def __init__(self, name, limit=10, config="index.cursor", workers=0, cache=True,
+                    parser=PARSER):
+        """
+        Streams the extracted documents of the pages stored for
+        `name`, one page in memory at a time
+
+        The position saved in `config` only moves on when the
+        consumer calls :meth:`commit`, after it has durably indexed
+        what it was given, so a failed run starts again from the
+        last commit instead of skipping documents
+
+        :param name: crawler working dir, i.e `nairaland`
+        :param limit: max pages to read
+        :param config: file holding the position, a position in
+                       the store's log of writes (not a page count)
+        :param workers: extraction processes, 0 to extract in
+                        this process, `None` for all cores
+        :param cache: keep extracted documents in `<name>/extracted`
+                      so unchanged pages aren't parsed again
+        :param parser: BeautifulSoup tree builder, see `PARSER`
+        """
+        self.name     = name
+        self.limit    = limit
+        self.config   = config
+        self.workers  = workers
+        self.parser   = parser
+        self.cache    = None
+        self.start    = get_cursor(config)
+        self.position = self.start
+
+        if cache:
+            self.cache = ExtractCache(os.path.join(name, "extracted"), EXTRACT_VERSION)
+
+    def __iter__(self):
+        pages = islice(get_site_pages(self.name, self.position), self.limit)
+
+        extracted = extract_pages(pages, self.workers, cache=self.cache,
+                                    parser=self.parser)
+
+        for e_data, position in extracted:
+            # moved before the yield: a commit made while this
+            # document is being handled covers it
+            self.position = position
+
             if e_data:
-                data.append(e_data)
-        
-        n += 1
-        k += 1
-        print(i)
-        if k >= limit:
-            break
+                yield e_data
 
-    get_config("index.config", n)
-        
-    return data
+    def commit(self):
+        """
+        Saves the position after the last document handed out
+        """
+        if self.cache is not None:
+            self.cache.flush()
+
+        if self.position != self.start:
+            set_cursor(self.config, self.position)
+            self.start = self.position
+
+def stream_index_data(name, limit=10, workers=0, parser=PARSER):
+    """
+    :param workers: extraction processes, see :class:`IndexData`
+    :param parser: BeautifulSoup tree builder, see `PARSER`
+    """
+    return IndexData(name, limit, workers=workers, parser=parser)
+
+def get_index_data(name, limit=10, workers=0, parser=PARSER):
+    """
+    Same as :func:`stream_index_data` but returns a list
+    and moves the position on right away
+    """
+    data = IndexData(name, limit, workers=workers, parser=parser)
+    docs = list(data)
+    data.commit()
+
+    return docs
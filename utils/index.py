@@ -82,6 +82,12 @@ class Index:
         with self.ix.writer() as writer: 
             for d in data:
                 writer.add_document(**{k:d.get(k, "") for k in self.fields})
+
+        # i.e :class:`utils.extract.IndexData`, whose position
+        # should only move once the writer has committed
+        commit = getattr(data, "commit", None)
+        if commit:
+            commit()
     
     def search(self, fields, query, page=1, pagelen=20):
         """Searches the index for the given `query` 